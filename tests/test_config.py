@@ -0,0 +1,19 @@
+from __future__ import annotations
+from pydantic import ValidationError
+from pytest import raises
+from toml import load
+from worker.config import Config
+
+
+def test_transport_profile_validation() -> None:
+    raw = load("tests/config.test.toml")
+    raw["profiles"] = {"bulk": {"ciphers": ["aes128-ctr"], "macs": ["hmac-sha2-256"]}}
+    raw["server"]["profile"] = "bulk"
+    assert Config.model_validate(raw).transport_profile().ciphers == ["aes128-ctr"]
+    raw["server"]["profile"] = "missing"
+    with raises(ValidationError, match="Unknown transport profile"):
+        _ = Config.model_validate(raw)
+    raw["server"]["profile"] = "bulk"
+    raw["profiles"]["bulk"]["ciphers"] = ["rot13"]
+    with raises(ValidationError, match="Unsupported cipher rot13"):
+        _ = Config.model_validate(raw)
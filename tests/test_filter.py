@@ -0,0 +1,47 @@
+from __future__ import annotations
+from io import BytesIO
+from ipaddress import ip_network
+from worker.filter import FilterRules, filter_pcap
+from worker.pcap import read_packets
+from test_pcap import packets_pcap, synthetic_pcap, tcp_packet
+
+
+def test_filter_pcap_rules() -> None:
+    pcap = packets_pcap(
+        [
+            tcp_packet("10.60.1.1", 40000, "10.60.16.1", 8080, b"a" * 60),
+            tcp_packet("10.60.16.1", 8080, "10.60.1.1", 40000, b"b" * 60),
+            tcp_packet("10.60.1.1", 40000, "10.60.16.1", 8080, b"c" * 60),
+            tcp_packet("10.60.1.1", 40001, "10.60.16.1", 22, b"ssh"),
+            tcp_packet("10.10.0.5", 40002, "10.60.16.1", 8080, b"checker"),
+            tcp_packet("10.60.1.1", 40003, "10.60.16.1", 9999, b"other"),
+            bytes(64),
+        ]
+    )
+    rules = FilterRules(
+        frozenset([22]),
+        (ip_network("10.10.0.0/16"),),
+        frozenset([8080]),
+        100,
+    )
+    output = BytesIO()
+    stats = filter_pcap(BytesIO(pcap), output, rules)
+    _ = output.seek(0)
+    kept = [packet.data[-60:] for _, packet in read_packets(output)]
+    assert kept == [b"a" * 60, b"b" * 60]
+    assert stats.kept_packets == 2 and stats.packets == 7
+    assert stats.dropped == {
+        "flow size": 1,
+        "port": 1,
+        "host": 1,
+        "service": 1,
+        "protocol": 1,
+    }
+
+
+def test_filter_pcap_empty() -> None:
+    pcap = synthetic_pcap(0)
+    output = BytesIO()
+    rules = FilterRules(frozenset(), (), frozenset([80]), None)
+    assert filter_pcap(BytesIO(pcap), output, rules).packets == 0
+    assert output.getvalue() == pcap
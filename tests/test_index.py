@@ -0,0 +1,27 @@
+from __future__ import annotations
+from io import BytesIO
+from worker.index import open_index, summarize_pcap
+from test_pcap import packets_pcap, tcp_packet
+
+
+def test_index_query() -> None:
+    pcap = packets_pcap(
+        [
+            tcp_packet("10.60.42.1", 40000, "10.60.16.1", 8080, b"get"),
+            tcp_packet("10.60.1.1", 40001, "10.60.16.1", 5432, b"db"),
+            tcp_packet("10.60.16.1", 8080, "10.60.42.1", 40000, b"flag"),
+        ]
+    )
+    summary = summarize_pcap(BytesIO(pcap))
+    assert summary.packets == 3 and len(summary.flows) == 2
+    index = open_index(":memory:")
+    index.add("13-05-00.pcap", summary)
+    [entry] = index.query(host="10.60.42.1", port=8080)
+    assert entry.file == "13-05-00.pcap"
+    assert entry.destination_port == 8080 and entry.packets == 2
+    assert (entry.first, entry.last) == (1000, 1000.02)
+    assert entry.first_offset == 24
+    assert len(index.query(start=1000.01)) == 2
+    assert index.query(end=999) == []
+    index.remove("13-05-00.pcap")
+    assert index.query() == []
@@ -0,0 +1,45 @@
+from __future__ import annotations
+from worker.journal import open_journal
+
+
+def test_journal_record_keeps_download_metadata() -> None:
+    journal = open_journal(":memory:")
+    assert journal.get("10-00-00.pcap") is None
+    journal.reset("10-00-00.pcap", "downloaded", "abcd", 100, 1000)
+    journal.record("10-00-00.pcap", "submitted")
+    entry = journal.get("10-00-00.pcap")
+    assert entry is not None
+    assert (entry.stage, entry.checksum, entry.size, entry.mtime) == (
+        "submitted",
+        "abcd",
+        100,
+        1000,
+    )
+
+
+def test_journal_reset_replaces_capture() -> None:
+    journal = open_journal(":memory:")
+    journal.reset("10-00-00.pcap", "downloaded", "abcd", 100, 1000)
+    journal.record("10-00-00.pcap", "backed_up")
+    journal.reset("10-00-00.pcap", "extracted", "efgh", 200, 2000)
+    entry = journal.get("10-00-00.pcap")
+    assert entry is not None
+    assert (entry.stage, entry.checksum, entry.size, entry.mtime) == (
+        "extracted",
+        "efgh",
+        200,
+        2000,
+    )
+
+
+def test_journal_record_without_download() -> None:
+    journal = open_journal(":memory:")
+    journal.record("10-00-00.pcap", "extracted")
+    entry = journal.get("10-00-00.pcap")
+    assert entry is not None
+    assert (entry.stage, entry.checksum, entry.size, entry.mtime) == (
+        "extracted",
+        None,
+        None,
+        None,
+    )
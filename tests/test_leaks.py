@@ -0,0 +1,39 @@
+from __future__ import annotations
+from ipaddress import ip_address
+from re import compile
+from pytest import MonkeyPatch
+from worker.config import Config
+from worker.leaks import LeakDetector, vulnbox_address
+from test_pcap import packets_pcap, tcp_packet
+
+
+def test_leak_detector_reassembles_streams() -> None:
+    flag = b"A" * 31 + b"="
+    pcap = packets_pcap(
+        [
+            tcp_packet("10.60.1.1", 40000, "10.60.16.1", 8080, flag, 1),
+            tcp_packet("10.60.16.1", 8080, "10.60.1.1", 40000, b"x" + flag[:10], 100),
+            tcp_packet("10.60.16.1", 8080, "10.60.1.1", 40000, flag[10:], 111),
+            tcp_packet("10.60.16.1", 8080, "10.60.1.1", 40000, flag[10:], 111),
+            tcp_packet("10.60.16.1", 5432, "10.60.1.1", 40001, flag, 500),
+        ]
+    )
+    detector = LeakDetector(
+        "13-05-00.pcap",
+        compile(b"[A-Z0-9]{31}="),
+        ip_address("10.60.16.1"),
+        {8080: "web"},
+        None,
+    )
+    for i in range(0, len(pcap), 50):
+        detector.feed(pcap[i : i + 50])
+    assert detector.leaks == {"web": 1, "other": 1}
+
+
+def test_vulnbox_address_prefers_game_ip(
+    test_config: Config, monkeypatch: MonkeyPatch
+) -> None:
+    assert vulnbox_address() == ip_address("10.89.12.25")
+    monkeypatch.setattr(test_config.server, "game_ip", None)
+    monkeypatch.setattr(test_config.server, "host", "10.60.16.1")
+    assert vulnbox_address() == ip_address("10.60.16.1")
@@ -0,0 +1,185 @@
+from __future__ import annotations
+from io import BytesIO
+from ipaddress import ip_address
+from struct import pack
+from typing import BinaryIO
+from typing_extensions import override
+from worker.pcap import (
+    Packet,
+    PcapFormat,
+    PcapParser,
+    PcapWriter,
+    decode_packet,
+    demux_pcap,
+    merge_pcaps,
+    read_packets,
+    split_pcap,
+)
+
+
+def synthetic_pcap(packets: int, start: float = 1000, size: int = 100) -> bytes:
+    result = bytearray(pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 262144, 1))
+    for i in range(packets):
+        timestamp = start + i / 100
+        data = bytes([i % 256]) * size
+        result += pack(
+            "<IIII",
+            int(timestamp),
+            round(timestamp % 1 * 1e6),
+            len(data),
+            len(data),
+        )
+        result += data
+    return bytes(result)
+
+
+def tcp_packet(
+    source: str,
+    source_port: int,
+    destination: str,
+    destination_port: int,
+    payload: bytes = b"",
+    sequence: int = 0,
+) -> bytes:
+    tcp = pack(
+        ">HHIIBBHHH",
+        source_port,
+        destination_port,
+        sequence,
+        0,
+        5 << 4,
+        0x18,
+        65535,
+        0,
+        0,
+    )
+    ip = pack(
+        ">BBHHHBBH4s4s",
+        0x45,
+        0,
+        20 + len(tcp) + len(payload),
+        0,
+        0,
+        64,
+        6,
+        0,
+        ip_address(source).packed,
+        ip_address(destination).packed,
+    )
+    return bytes(12) + pack(">H", 0x0800) + ip + tcp + payload
+
+
+def packets_pcap(packets: list[bytes], start: float = 1000) -> bytes:
+    result = bytearray(pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 262144, 1))
+    for i, data in enumerate(packets):
+        timestamp = start + i / 100
+        result += pack(
+            "<IIII",
+            int(timestamp),
+            round(timestamp % 1 * 1e6),
+            len(data),
+            len(data),
+        )
+        result += data
+    return bytes(result)
+
+
+def test_pcap_parser_chunks() -> None:
+    pcap = synthetic_pcap(100)
+    parser = PcapParser()
+    packets = [
+        packet
+        for i in range(0, len(pcap), 7)
+        for packet in parser.feed(pcap[i : i + 7])
+    ]
+    parser.close()
+    assert len(packets) == 100
+    assert packets[1].offset == 24 + 116
+    assert parser.format is not None
+    assert parser.format.timestamp(packets[50]) == 1000.5
+
+
+def test_pcap_writer_roundtrip() -> None:
+    pcap = synthetic_pcap(10)
+    output = BytesIO()
+    writer = None
+    for format, packet in read_packets(BytesIO(pcap)):
+        if writer is None:
+            writer = PcapWriter(output, format)
+        writer.write(packet)
+    assert writer is not None
+    assert writer.size == len(pcap)
+    assert output.getvalue() == pcap
+
+
+def test_merge_pcaps_keeps_packets() -> None:
+    pcaps = [synthetic_pcap(10, start) for start in (1000, 2000, 3000)]
+    output = BytesIO()
+    merge_pcaps([BytesIO(pcap) for pcap in pcaps], output)
+    _ = output.seek(0)
+    packets = [packet for _, packet in read_packets(output)]
+    assert len(packets) == 30
+    assert output.getvalue() == pcaps[0] + b"".join(pcap[24:] for pcap in pcaps[1:])
+
+
+def test_split_pcap_at_packet_boundaries() -> None:
+    pcap = synthetic_pcap(100)
+    parts: list[BytesIO] = []
+
+    def open_part(_: int) -> BinaryIO:
+        parts.append(NonClosingBytesIO())
+        return parts[-1]
+
+    assert split_pcap(BytesIO(pcap), 1000, open_part) == 13
+    assert all(len(part.getvalue()) <= 1000 for part in parts)
+    output = BytesIO()
+    merge_pcaps([BytesIO(part.getvalue()) for part in parts], output)
+    assert output.getvalue() == pcap
+
+
+class NonClosingBytesIO(BytesIO):
+    @override
+    def close(self) -> None:
+        ...
+
+
+def test_decode_packet_tcp() -> None:
+    pcap = packets_pcap([tcp_packet("10.60.1.1", 40000, "10.60.16.1", 8080, b"hi", 7)])
+    [(format, packet)] = list(read_packets(BytesIO(pcap)))
+    segment = decode_packet(format, packet)
+    assert segment is not None
+    assert segment.flow.destination == ip_address("10.60.16.1")
+    assert segment.flow.destination_port == 8080
+    assert segment.sequence == 7
+    assert packet.data[segment.start : segment.end] == b"hi"
+    assert segment.flow.key() == segment.flow.reversed().key()
+
+
+def test_demux_pcap_by_port() -> None:
+    pcap = packets_pcap(
+        [
+            tcp_packet("10.60.1.1", 40000, "10.60.16.1", 8080, b"web"),
+            tcp_packet("10.60.1.1", 40001, "10.60.16.1", 5432, b"db"),
+            tcp_packet("10.60.16.1", 8080, "10.60.1.1", 40000, b"web"),
+        ]
+    )
+    parts: dict[str, BytesIO] = {}
+
+    def open_part(key: str) -> BinaryIO:
+        parts[key] = NonClosingBytesIO()
+        return parts[key]
+
+    def classify(format: PcapFormat, packet: Packet) -> str:
+        segment = decode_packet(format, packet)
+        assert segment is not None
+        return (
+            "web"
+            if 8080 in (segment.flow.source_port, segment.flow.destination_port)
+            else "db"
+        )
+
+    assert demux_pcap(BytesIO(pcap), classify, open_part) == {"web": 2, "db": 1}
+    packets = [
+        packet.data for _, packet in read_packets(BytesIO(parts["web"].getvalue()))
+    ]
+    assert [data[-3:] for data in packets] == [b"web", b"web"]
@@ -0,0 +1,59 @@
+from __future__ import annotations
+from queue import Queue
+from threading import Event
+from pytest import MonkeyPatch
+from worker.pipeline import MAX_ATTEMPTS, Stage, start_pipeline
+
+
+def test_pipeline_retries_failures() -> None:
+    attempts: list[int] = []
+    results: Queue[int] = Queue()
+
+    def flaky(item: int) -> list[int]:
+        attempts.append(item)
+        if len(attempts) == 1:
+            raise OSError("Caronte is unreachable")
+        return [item * 2]
+
+    def collect(item: int) -> list[None]:
+        results.put(item)
+        return []
+
+    pipeline = start_pipeline([Stage("flaky", flaky), Stage("collect", collect)], 4)
+    _ = pipeline.put(21)
+    assert results.get(timeout=5) == 42
+    assert attempts == [21, 21]
+
+
+def test_pipeline_join_waits_for_retries(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr("worker.pipeline.RETRY_INTERVAL", 0.1)
+    attempts: list[int] = []
+
+    def failing(item: int) -> list[None]:
+        attempts.append(item)
+        raise OSError("Disk full")
+
+    pipeline = start_pipeline([Stage("failing", failing)], 4)
+    _ = pipeline.put(1)
+    pipeline.join()
+    assert attempts == [1] * MAX_ATTEMPTS
+
+
+def test_pipeline_skips_items_in_flight() -> None:
+    release = Event()
+    started: list[str] = []
+
+    def blocking(item: str) -> list[None]:
+        started.append(item)
+        _ = release.wait(5)
+        return []
+
+    pipeline = start_pipeline([Stage("blocking", blocking, 2)], 4)
+    assert pipeline.put("a", key="a")
+    assert not pipeline.put("a", key="a")
+    assert pipeline.put("b", key="b")
+    release.set()
+    pipeline.join()
+    assert sorted(started) == ["a", "b"]
+    assert pipeline.put("a", key="a")
+    pipeline.join()
@@ -0,0 +1,76 @@
+from __future__ import annotations
+from time import monotonic
+from attrs import define, field
+from pytest import MonkeyPatch, approx, fixture
+from worker.ratelimit import RTT_INTERVAL, RateLimiter
+
+
+@define
+class FakeClock:
+    now: float = field(factory=monotonic)
+    sleeps: list[float] = field(factory=list[float])
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sync(self) -> None:
+        self.now = monotonic()
+
+    def sleep(self, delay: float) -> None:
+        self.sleeps.append(delay)
+        self.now += delay
+
+
+@fixture
+def clock(monkeypatch: MonkeyPatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr("worker.ratelimit.monotonic", clock.monotonic)
+    monkeypatch.setattr("worker.ratelimit.sleep", clock.sleep)
+    return clock
+
+
+def test_rate_limiter_token_bucket(clock: FakeClock) -> None:
+    limiter = RateLimiter(1000)
+    clock.sync()
+    limiter.acquire(1000)
+    assert clock.sleeps == []
+    limiter.acquire(500)
+    limiter.acquire(500)
+    assert clock.sleeps == [approx(0.5, abs=1e-3), approx(0.5, abs=1e-3)]
+    clock.now += 10
+    limiter.acquire(1000)
+    assert len(clock.sleeps) == 2
+
+
+def test_rate_limiter_unlimited(clock: FakeClock) -> None:
+    limiter = RateLimiter(None, adaptive=True)
+    limiter.acquire(10**9)
+    limiter.observe_rtt(1)
+    assert clock.sleeps == [] and limiter.rate is None
+    assert not limiter.rtt_due()
+
+
+def test_rate_limiter_rtt_due(clock: FakeClock) -> None:
+    assert not RateLimiter(1000).rtt_due()
+    limiter = RateLimiter(1000, adaptive=True)
+    clock.sync()
+    assert not limiter.rtt_due()
+    clock.now += RTT_INTERVAL
+    assert limiter.rtt_due()
+    assert not limiter.rtt_due()
+
+
+def test_rate_limiter_observe_rtt(clock: FakeClock) -> None:
+    limiter = RateLimiter(1600, adaptive=True)
+    limiter.observe_rtt(0.01)
+    assert limiter.rate == 1600
+    rates: list[float | None] = []
+    for _ in range(6):
+        limiter.observe_rtt(0.1)
+        rates.append(limiter.rate)
+    assert rates == [800, 400, 200, 100, 100, 100]
+    rates = []
+    for _ in range(16):
+        limiter.observe_rtt(0.01)
+        rates.append(limiter.rate)
+    assert rates[:3] == [200, 300, 400] and rates[-2:] == [1600, 1600]
@@ -0,0 +1,72 @@
+from __future__ import annotations
+from os import listdir, utime
+from pathlib import Path
+from shutil import disk_usage
+from time import time
+from pytest import MonkeyPatch, fixture
+from worker.config import Config
+from worker.index import CaptureSummary, get_index, open_index
+from worker.retention import RetentionStats, enforce_retention
+
+NAMES = ["10-00-00.pcap", "10-01-00.pcap.gz", "10-02-00.pcap"]
+
+
+@fixture
+def retention_folders(
+    test_config: Config, tmp_path: Path, monkeypatch: MonkeyPatch
+) -> Path:
+    backup_folder = tmp_path / "backup"
+    staging_folder = tmp_path / "uncompressed"
+    backup_folder.mkdir()
+    staging_folder.mkdir()
+    monkeypatch.setattr("worker.retention.BACKUP_FOLDER", str(backup_folder))
+    monkeypatch.setattr("worker.retention.DATA_FOLDER", str(tmp_path))
+    monkeypatch.setattr("worker.retention.STAGING_FOLDERS", [str(staging_folder)])
+    monkeypatch.setattr("worker.index.index", open_index(":memory:"))
+    for name in ["max_bytes", "max_age", "min_free_bytes"]:
+        monkeypatch.setattr(test_config.retention, name, None)
+    now = time()
+    for age, name in zip([3000, 2000, 1000], NAMES):
+        _ = (backup_folder / name).write_bytes(bytes(100))
+        utime(backup_folder / name, (now - age, now - age))
+        get_index().add(name, CaptureSummary())
+    _ = (staging_folder / "10-03-00.pcap").write_bytes(bytes(50))
+    return backup_folder
+
+
+def test_retention_max_bytes(test_config: Config, retention_folders: Path) -> None:
+    test_config.retention.max_bytes = 260
+    stats = RetentionStats()
+    enforce_retention(stats)
+    assert sorted(listdir(retention_folders)) == NAMES[1:]
+    assert (stats.evicted_files, stats.evicted_bytes) == (1, 100)
+    assert set(get_index().spans()) == set(NAMES[1:])
+
+
+def test_retention_max_age(test_config: Config, retention_folders: Path) -> None:
+    test_config.retention.max_age = 1500
+    enforce_retention(RetentionStats())
+    assert listdir(retention_folders) == NAMES[2:]
+
+
+def test_retention_min_free_bytes(
+    test_config: Config, retention_folders: Path, monkeypatch: MonkeyPatch
+) -> None:
+    usage = disk_usage(retention_folders)
+
+    def low_disk_usage(path: str):
+        return usage._replace(free=1000)
+
+    monkeypatch.setattr("worker.retention.disk_usage", low_disk_usage)
+    test_config.retention.min_free_bytes = 1150
+    stats = RetentionStats()
+    enforce_retention(stats)
+    assert listdir(retention_folders) == NAMES[2:]
+    assert stats.evicted_bytes == 200
+
+
+def test_retention_keeps_staging(test_config: Config, retention_folders: Path) -> None:
+    test_config.retention.max_bytes = 0
+    enforce_retention(RetentionStats())
+    assert listdir(retention_folders) == []
+    assert listdir(retention_folders.parent / "uncompressed") == ["10-03-00.pcap"]
@@ -1,11 +1,54 @@
 from __future__ import annotations
+from worker.scripts.replay import select_backups
 from worker.scripts.setup_git import setup_git
 from worker.scripts.setup_keys import get_aliases, get_aliases_command
 from worker.ssh import SSH
 from worker.config import Config
 from tempfile import TemporaryDirectory, NamedTemporaryFile
 from subprocess import call, run, PIPE, check_call
-from os import environ
+from os import environ, utime
+from pathlib import Path
+from ipaddress import ip_address
+from worker.index import CaptureSummary, FlowSummary, open_index
+from worker.pcap import PROTOCOL_TCP, Flow
+
+
+def flow_summary(first: float, last: float, port: int) -> CaptureSummary:
+    flow = Flow(
+        PROTOCOL_TCP, ip_address("10.60.1.1"), 40000, ip_address("10.60.16.1"), port
+    )
+    summary = CaptureSummary(first, last, 1, 100)
+    summary.flows[flow.key()] = FlowSummary(flow, first, last, 24, 24, 1, 100)
+    return summary
+
+
+def test_scripts_replay_select_backups(test_config: Config, tmp_path: Path) -> None:
+    index = open_index(":memory:")
+    index.add("10-00-00.pcap", flow_summary(1000, 1060, 8080))
+    index.add("10-01-00.pcap.gz", flow_summary(2000, 2060, 22))
+    for name, mtime in [
+        ("10-00-00.pcap", 5000),
+        ("10-01-00.pcap.gz", 5000),
+        ("10-02-00.pcap", 3000),
+        ("notes.txt", 3000),
+    ]:
+        _ = (tmp_path / name).write_bytes(bytes(10))
+        utime(tmp_path / name, (mtime, mtime))
+
+    def select(
+        start: float | None, end: float | None, ports: list[int] | None
+    ) -> list[str]:
+        backups = select_backups(index, str(tmp_path), start, end, ports)
+        return [Path(path).name for _, path, _ in backups]
+
+    assert select(None, None, None) == [
+        "10-00-00.pcap",
+        "10-01-00.pcap.gz",
+        "10-02-00.pcap",
+    ]
+    assert select(1500, 2500, None) == ["10-01-00.pcap.gz"]
+    assert select(2999, None, None) == ["10-02-00.pcap"]
+    assert select(None, None, [8080]) == ["10-00-00.pcap", "10-02-00.pcap"]
 
 
 def test_scripts_aliases_shell_escape(test_config: Config):
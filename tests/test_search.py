@@ -0,0 +1,39 @@
+from __future__ import annotations
+from io import BytesIO
+from worker.search import search_data, search_stream
+from test_pcap import packets_pcap, tcp_packet
+
+
+def test_search_data_hits() -> None:
+    flag = b"A" * 31 + b"="
+    pcap = packets_pcap(
+        [
+            tcp_packet("10.60.1.1", 40000, "10.60.16.1", 8080, b"get"),
+            tcp_packet("10.60.16.1", 8080, "10.60.1.1", 40000, b"flag " + flag),
+        ]
+    )
+    [hit] = search_data("13-05-00.pcap", pcap, ["[A-Z0-9]{31}="])
+    assert hit.match == flag.decode()
+    assert hit.offset == 24 + 16 + 57
+    assert (hit.source, hit.source_port) == ("10.60.16.1", 8080)
+    assert hit.timestamp == 1000.01
+    assert search_data("13-05-00.pcap", pcap, ["nothing"]) == []
+
+
+def test_search_stream_matches_search_data() -> None:
+    flag = b"A" * 31 + b"="
+    pcap = packets_pcap(
+        [
+            tcp_packet("10.60.16.1", 8080, "10.60.1.1", 40000, b"flag " + flag, i)
+            for i in range(20)
+        ]
+    )
+    hits = search_data("13-05-00.pcap.gz", pcap, ["[A-Z0-9]{31}="])
+    assert len(hits) == 20
+    for chunk_size in [7, 100, len(pcap)]:
+        assert (
+            search_stream(
+                "13-05-00.pcap.gz", BytesIO(pcap).read, ["[A-Z0-9]{31}="], chunk_size
+            )
+            == hits
+        )
@@ -0,0 +1,103 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from time import sleep
+from typing import Any, cast
+from attrs import define, field
+from paramiko import Channel, SSHClient, SSHException
+from pytest import raises
+from result import Err, Ok, Result
+from worker.ssh import SSH, SSHError, SSHStream, log_stderr
+
+
+@define
+class StubTransport:
+    reply: Event = field(factory=Event)
+    active: bool = True
+    requests: int = 0
+
+    def is_active(self) -> bool:
+        return self.active
+
+    def close(self) -> None:
+        self.active = False
+
+    def global_request(self, kind: str, wait: bool = True) -> Any:
+        self.requests += 1
+        while self.active and not self.reply.wait(0.01):
+            pass
+
+
+@define
+class StubClient:
+    transport: StubTransport
+
+    def get_transport(self) -> StubTransport:
+        return self.transport
+
+
+def test_stream_closed_channel() -> None:
+    channel = Channel(0)
+    channel.in_buffer.feed(b"data")
+    channel.closed = True
+    stream = SSHStream(channel, log_stderr, 1024)
+    assert list(stream.chunks(heartbeat=True)) == [b"data"]
+    assert list(stream.chunks()) == []
+
+
+def test_stream_lines_heartbeat() -> None:
+    channel = Channel(0)
+    stream = SSHStream(channel, log_stderr, 1024)
+    assert next(stream.lines(heartbeat=True)) == b""
+    channel.in_buffer.feed(b"a.gz\nb.gz")
+    channel.closed = True
+    assert [line for line in stream.lines(heartbeat=True) if line] == [
+        b"a.gz",
+        b"b.gz",
+    ]
+
+
+def test_ping_reply() -> None:
+    transport = StubTransport()
+    transport.reply.set()
+    result = SSH(cast(SSHClient, StubClient(transport))).ping(1)
+    assert result.is_ok() and transport.active
+
+
+def test_ping_timeout_closes_transport() -> None:
+    transport = StubTransport()
+    ssh = SSH(cast(SSHClient, StubClient(transport)))
+    assert ssh.ping(0.1).is_err()
+    assert not transport.active
+    assert ssh.ping(0.1).is_err()
+    assert transport.requests == 1
+
+
+def test_ping_serialized() -> None:
+    transport = StubTransport()
+    ssh = SSH(cast(SSHClient, StubClient(transport)))
+    with ThreadPoolExecutor(1) as executor:
+        first = executor.submit(ssh.ping, 5)
+        sleep(0.1)
+        assert ssh.ping(0.1).is_err()
+        assert transport.requests == 1 and transport.active
+        transport.reply.set()
+        assert first.result().is_ok()
+    assert ssh.ping(1).is_ok() and transport.requests == 2
+
+
+def test_stream_dead_link() -> None:
+    pings: list[float] = []
+
+    def ping() -> Result[float, SSHError]:
+        pings.append(0)
+        if len(pings) == 1:
+            return Ok(0)
+        return Err(SSHException("No ping reply"))
+
+    stream = SSHStream(Channel(0), log_stderr, 1024, ping, 0)
+    chunks = stream.chunks(heartbeat=True)
+    assert next(chunks) == b""
+    with raises(SSHException):
+        _ = next(chunks)
+    assert len(pings) == 2
@@ -1,9 +1,321 @@
 from __future__ import annotations
-from worker.worker import worker_check
-from worker.ssh import SSH
+from collections.abc import Callable
+from collections import deque
+from pathlib import Path
+from typing import Any, cast
+from attrs import define, field
+from paramiko import SFTPAttributes
+from pytest import MonkeyPatch, fixture
+from result import Ok, Result
+from worker.config import Config, Service
+from worker.index import open_index
+from worker.journal import get_journal, open_journal
+from worker.ratelimit import RateLimiter
+from worker.worker import (
+    download,
+    fetch_dumps,
+    next_capture,
+    resume_offset,
+    upload,
+    upload_all,
+    upload_captures,
+    worker_check,
+)
+from worker.ssh import SSH, SSHError
 from tempfile import TemporaryDirectory
 from subprocess import check_call
-from os.path import join
+from os import listdir, utime
+from os.path import basename, exists, join
+from struct import pack
+from hashlib import sha256
+from gzip import compress
+
+WORKER_FOLDERS = [
+    "COMPRESSED_FOLDER",
+    "UNCOMPRESSED_FOLDER",
+    "BACKUP_FOLDER",
+    "PARTIAL_FOLDER",
+]
+NAMES = ["10-00-00.pcap", "10-01-00.pcap"]
+
+
+@define
+class StubSSH:
+    data: bytes
+    mtime: int = 1000
+    missing: int = 0
+    digest: str | None = None
+    removed: list[str] = field(factory=list[str])
+
+    def stat(self, remote_path: str) -> Result[SFTPAttributes, SSHError]:
+        attributes = SFTPAttributes()
+        attributes.st_size = len(self.data)
+        attributes.st_mtime = self.mtime
+        return Ok(attributes)
+
+    def remove(self, remote_path: str) -> Result[None, SSHError]:
+        self.removed.append(remote_path)
+        return Ok(None)
+
+    def read(
+        self,
+        remote_path: str,
+        onchunk: Callable[[bytes], Any],
+        prefetch_requests: int | None = None,
+        block_size: int = 32768,
+        offset: int = 0,
+        limiter: RateLimiter | None = None,
+    ) -> Result[int, SSHError]:
+        data = self.data[offset : len(self.data) - self.missing]
+        onchunk(data)
+        return Ok(len(data))
+
+    def run(self, command: str) -> Result[tuple[int, bytes, bytes], SSHError]:
+        digest = self.digest or sha256(self.data).hexdigest()
+        return Ok((0, f"{digest}  {command.split()[-1]}\n".encode(), b""))
+
+    def read_range(
+        self, remote_path: str, offset: int, size: int
+    ) -> Result[bytes, SSHError]:
+        return Ok(self.data[offset : offset + size])
+
+
+@fixture
+def worker_folders(
+    test_config: Config, tmp_path: Path, monkeypatch: MonkeyPatch
+) -> Path:
+    for folder in WORKER_FOLDERS:
+        path = tmp_path / folder.lower()
+        path.mkdir()
+        monkeypatch.setattr(f"worker.worker.{folder}", str(path))
+    monkeypatch.setattr("worker.journal.journal", open_journal(":memory:"))
+    monkeypatch.setattr("worker.index.index", open_index(":memory:"))
+    return tmp_path
+
+
+def test_worker_download_skips_journaled(worker_folders: Path) -> None:
+    client = StubSSH(b"pcap")
+    get_journal().reset("10-00-00.pcap", "backed_up", "abcd", 4, 1000)
+    assert download(cast(SSH, client), "10-00-00.pcap.gz") == Ok(None)
+    assert len(client.removed) == 1
+    assert not exists(worker_folders / "compressed_folder" / "10-00-00.pcap.gz")
+
+
+def test_worker_download_changed_capture(worker_folders: Path) -> None:
+    client = StubSSH(b"pcap", 2000)
+    get_journal().reset("10-00-00.pcap", "backed_up", "abcd", 4, 1000)
+    local_file = str(worker_folders / "compressed_folder" / "10-00-00.pcap.gz")
+    assert download(cast(SSH, client), "10-00-00.pcap.gz") == Ok(local_file)
+    entry = get_journal().get("10-00-00.pcap")
+    assert entry is not None and (entry.stage, entry.mtime) == ("downloaded", 2000)
+
+
+def test_worker_upload_skips_submitted(
+    worker_folders: Path, monkeypatch: MonkeyPatch
+) -> None:
+    submitted: list[str] = []
+    monkeypatch.setattr("worker.worker.submit_pcap", submitted.append)
+    files = [str(worker_folders / "uncompressed_folder" / name) for name in NAMES]
+    for file in files:
+        _ = Path(file).write_bytes(b"")
+    get_journal().record(NAMES[0], "submitted")
+    for file in files:
+        upload(file)
+    assert submitted == files[1:]
+    for name in NAMES:
+        assert exists(worker_folders / "backup_folder" / name)
+        entry = get_journal().get(name)
+        assert entry is not None and entry.stage == "backed_up"
+
+
+def write_captures(folder: Path, names: list[str], data: bytes = b"") -> list[str]:
+    files: list[str] = []
+    for mtime, name in enumerate(names, 1):
+        _ = (folder / name).write_bytes(data)
+        utime(folder / name, (mtime, mtime))
+        files.append(str(folder / name))
+    return files
+
+
+def test_worker_upload_newest_first_when_behind(
+    worker_folders: Path, monkeypatch: MonkeyPatch
+) -> None:
+    submitted: list[str] = []
+    slots = iter([1, 0, 5])
+
+    def import_slots(timeout: float | None = None) -> int:
+        return next(slots)
+
+    monkeypatch.setattr("worker.worker.submit_pcap", submitted.append)
+    monkeypatch.setattr("worker.worker.import_slots", import_slots)
+    files = write_captures(
+        worker_folders / "uncompressed_folder", [*NAMES, "10-02-00.pcap"]
+    )
+    assert upload_captures(files, 0) == files[:2]
+    assert submitted == files[2:]
+    assert upload_captures(files[:2], 0) == []
+    assert submitted == [files[2], *files[:2]]
+
+
+def free_slots(timeout: float | None = None) -> int:
+    return len(NAMES) + 1
+
+
+def test_worker_upload_service_priority(
+    test_config: Config, worker_folders: Path, monkeypatch: MonkeyPatch
+) -> None:
+    submitted: list[str] = []
+    monkeypatch.setitem(test_config.services, "web", Service(priority=1))
+    monkeypatch.setattr("worker.worker.submit_pcap", submitted.append)
+    monkeypatch.setattr("worker.worker.import_slots", free_slots)
+    files = write_captures(
+        worker_folders / "uncompressed_folder",
+        ["other@10-00-00-0.batch.pcap", "10-01-00.pcap", "web@10-02-00-0.batch.pcap"],
+    )
+    assert upload_captures(files) == []
+    assert submitted == [files[2], files[0], files[1]]
+
+
+def test_worker_next_capture(test_config: Config, monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setitem(test_config.services, "web", Service(priority=1))
+    files = [
+        "10-00-00.pcap",
+        "web@10-01-00-0.batch.pcap",
+        "10-02-00.pcap",
+        "web@10-03-00-0.batch.pcap",
+    ]
+    assert next_capture(files.copy(), False) == files[1]
+    assert next_capture(files.copy(), True) == files[3]
+    queue = files.copy()
+    assert [next_capture(queue, True) for _ in files] == [
+        files[3],
+        files[1],
+        files[2],
+        files[0],
+    ]
+
+
+def test_worker_upload_all_order(
+    worker_folders: Path, monkeypatch: MonkeyPatch
+) -> None:
+    submitted: list[str] = []
+    slots = [len(NAMES) + 1]
+
+    def import_slots(timeout: float | None = None) -> int:
+        return slots[0]
+
+    monkeypatch.setattr("worker.worker.submit_pcap", submitted.append)
+    monkeypatch.setattr("worker.worker.import_slots", import_slots)
+    names = [*NAMES, "10-02-00.pcap"]
+    _ = write_captures(worker_folders / "uncompressed_folder", names)
+    upload_all()
+    assert [basename(file) for file in submitted] == names
+    submitted.clear()
+    slots[0] = 1
+    _ = write_captures(worker_folders / "uncompressed_folder", names)
+    upload_all()
+    assert [basename(file) for file in submitted] == names[::-1]
+
+
+def test_worker_upload_merges_held_captures(
+    test_config: Config, worker_folders: Path, monkeypatch: MonkeyPatch
+) -> None:
+    submitted: list[str] = []
+    monkeypatch.setattr(test_config.tcpdumper, "merge_size", 1024)
+    monkeypatch.setattr(test_config.tcpdumper, "merge_delay", 10**10)
+    monkeypatch.setattr("worker.worker.submit_pcap", submitted.append)
+    monkeypatch.setattr("worker.worker.import_slots", free_slots)
+    header = pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 262144, 1)
+    files = write_captures(worker_folders / "uncompressed_folder", NAMES, header)
+    assert upload_captures(files) == files
+    assert submitted == []
+    monkeypatch.setattr(test_config.tcpdumper, "merge_delay", 0)
+    assert upload_captures(files) == []
+    assert [basename(file) for file in submitted] == ["10-00-00-0.batch.pcap"]
+    assert sorted(listdir(worker_folders / "backup_folder")) == NAMES
+
+
+def test_worker_resume_offset(worker_folders: Path) -> None:
+    client = cast(SSH, StubSSH(bytes(range(256)) * 1024))
+    partial_file = worker_folders / "partial_folder" / "10-00-00.pcap.gz"
+    assert resume_offset(client, "", str(partial_file), 262144) == Ok(0)
+    _ = partial_file.write_bytes(bytes(range(256)) * 512)
+    assert resume_offset(client, "", str(partial_file), 262144) == Ok(131072)
+    assert partial_file.exists()
+
+
+def test_worker_resume_offset_discards_stale(worker_folders: Path) -> None:
+    client = cast(SSH, StubSSH(bytes(range(256)) * 1024))
+    partial_file = worker_folders / "partial_folder" / "10-00-00.pcap.gz"
+    for data in [bytes(131072), bytes(range(256)) * 1025]:
+        _ = partial_file.write_bytes(data)
+        assert resume_offset(client, "", str(partial_file), 262144) == Ok(0)
+        assert not partial_file.exists()
+
+
+def test_worker_download_resumes(worker_folders: Path) -> None:
+    data = bytes(range(256)) * 1024
+    _ = (worker_folders / "partial_folder" / "10-00-00.pcap.gz").write_bytes(
+        data[:1000]
+    )
+    local_file = worker_folders / "compressed_folder" / "10-00-00.pcap.gz"
+    assert download(cast(SSH, StubSSH(data)), "10-00-00.pcap.gz") == Ok(str(local_file))
+    assert local_file.read_bytes() == data
+
+
+def test_worker_download_truncated(worker_folders: Path) -> None:
+    client = StubSSH(bytes(range(256)) * 1024, missing=10)
+    result = download(cast(SSH, client), "10-00-00.pcap.gz")
+    assert result.is_err()
+    assert not (worker_folders / "partial_folder" / "10-00-00.pcap.gz").exists()
+    assert not (worker_folders / "compressed_folder" / "10-00-00.pcap.gz").exists()
+    assert client.removed == []
+
+
+def test_worker_fetch_retries_failed_dumps(
+    worker_folders: Path, monkeypatch: MonkeyPatch
+) -> None:
+    monkeypatch.setattr("worker.worker.extract_all", lambda: None)
+    monkeypatch.setattr("worker.worker.upload_all", lambda: None)
+    client = StubSSH(bytes(range(256)) * 1024, missing=10)
+    recent: deque[str] = deque()
+    fetch_dumps(cast(SSH, client), None, ["10-00-00.pcap.gz", "notes.txt"], recent)
+    assert not recent
+    client.missing = 0
+    fetch_dumps(cast(SSH, client), None, ["10-00-00.pcap.gz"], recent)
+    assert list(recent) == ["10-00-00.pcap.gz"]
+    fetch_dumps(cast(SSH, client), None, ["10-00-00.pcap.gz"], recent)
+    assert len(client.removed) == 1
+
+
+def test_worker_download_checksum_mismatch(worker_folders: Path) -> None:
+    client = StubSSH(bytes(range(256)) * 1024, digest=sha256(b"").hexdigest())
+    result = download(cast(SSH, client), "10-00-00.pcap.gz")
+    assert result.is_err()
+    assert not (worker_folders / "partial_folder" / "10-00-00.pcap.gz").exists()
+    assert not (worker_folders / "compressed_folder" / "10-00-00.pcap.gz").exists()
+    assert client.removed == []
+    assert get_journal().get("10-00-00.pcap") is None
+
+
+def test_worker_stream_extract_truncated(
+    test_config: Config, worker_folders: Path, monkeypatch: MonkeyPatch
+) -> None:
+    monkeypatch.setattr(test_config.tcpdumper, "stream_download", True)
+    monkeypatch.setattr(test_config.tcpdumper, "backup", "compressed")
+    data = bytes(range(256)) * 1024
+    client = StubSSH(compress(data), missing=10)
+    assert download(cast(SSH, client), "10-00-00.pcap.gz").is_err()
+    assert listdir(worker_folders / "partial_folder") == []
+    assert listdir(worker_folders / "uncompressed_folder") == []
+    assert listdir(worker_folders / "backup_folder") == []
+    assert client.removed == []
+    assert get_journal().get("10-00-00.pcap") is None
+    client.missing = 0
+    target_file = worker_folders / "uncompressed_folder" / "10-00-00.pcap"
+    assert download(cast(SSH, client), "10-00-00.pcap.gz") == Ok(str(target_file))
+    assert target_file.read_bytes() == data
+    assert listdir(worker_folders / "backup_folder") == ["10-00-00.pcap.gz"]
 
 
 def test_worker_healthcheck(remote_server: SSH) -> None:
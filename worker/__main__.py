@@ -14,12 +14,27 @@ from worker.scripts.autosetup import autosetup
 from worker.scripts.status import status
 from worker.scripts.check_keys import check_keys
 from worker.scripts.check_repo import check_repo
+from worker.scripts.benchmark import benchmark
+from worker.scripts.query import query
+from worker.scripts.search import search
+from worker.scripts.replay import replay
 from worker.config import load_config
 from logging import basicConfig, INFO, DEBUG
 from termcolor import cprint
 from typer import Option, Typer
 
-SCRIPTS = [setup_git, setup_keys, autosetup, status, check_keys, check_repo]
+SCRIPTS = [
+    setup_git,
+    setup_keys,
+    autosetup,
+    status,
+    check_keys,
+    check_repo,
+    benchmark,
+    query,
+    search,
+    replay,
+]
 SERVER_COMMANDS = [
     caronte,
     caronte_check,
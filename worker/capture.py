@@ -0,0 +1,100 @@
+from __future__ import annotations
+from collections.abc import Callable
+from os import rename
+from os.path import exists, join
+from shlex import quote
+from time import localtime, monotonic, strftime
+from typing import Any, BinaryIO
+from logging import getLogger
+from attrs import define, field
+from result import Err, Ok, Result
+from worker.config import (
+    BACKUP_FOLDER,
+    CAPTURE_SCRIPT,
+    PARTIAL_FOLDER,
+    UNCOMPRESSED_FOLDER,
+    get_config,
+)
+from worker.pcap import Packet, PcapError, PcapFormat, PcapParser, PcapWriter
+from worker.ssh import SSH, SSH_ERROR, SSHError
+from worker.journal import get_journal
+from worker.utils import stopping
+
+LOGGER = getLogger(__name__)
+
+
+@define
+class CaptureWriter:
+    _onfile: Callable[[str], Any]
+    _file: BinaryIO | None = field(default=None, init=False)
+    _writer: PcapWriter | None = field(default=None, init=False)
+    _name: str = field(default="", init=False)
+    _opened: float = field(default=0, init=False)
+
+    def write(self, format: PcapFormat, packet: Packet) -> None:
+        if self._writer is None:
+            self._name = capture_name(format.timestamp(packet))
+            self._file = open(join(PARTIAL_FOLDER, self._name), "wb")
+            self._writer = PcapWriter(self._file, format)
+            self._opened = monotonic()
+        self._writer.write(packet)
+
+    def rotate(self) -> None:
+        config = get_config()
+        if self._writer is None:
+            return
+        if (
+            self._writer.size >= config.tcpdumper.capture_max_size
+            or monotonic() - self._opened >= config.tcpdumper.interval
+        ):
+            self.close()
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        self._writer = None
+        target_file = join(UNCOMPRESSED_FOLDER, self._name)
+        rename(join(PARTIAL_FOLDER, self._name), target_file)
+        get_journal().record(self._name, "extracted")
+        LOGGER.debug(f"Captured file {self._name}")
+        self._onfile(target_file)
+
+
+def capture_name(timestamp: float) -> str:
+    base = strftime("%H-%M-%S", localtime(timestamp))
+    name = f"{base}.pcap"
+    index = 1
+    while exists(join(UNCOMPRESSED_FOLDER, name)) or exists(join(BACKUP_FOLDER, name)):
+        name = f"{base}-{index}.pcap"
+        index += 1
+    return name
+
+
+def capture(
+    ssh: SSH, onfile: Callable[[str], Any]
+) -> Result[int, SSHError | PcapError]:
+    config = get_config()
+    script = join(config.tcpdumper.dumps_folder, CAPTURE_SCRIPT)
+    with ssh.stream(f"sh {quote(script)}") as result:
+        if isinstance(result, Err):
+            return result
+        stream = result.ok_value
+        parser = PcapParser()
+        writer = CaptureWriter(onfile)
+        try:
+            for chunk in stream.chunks(heartbeat=True):
+                if stopping.is_set():
+                    return Ok(0)
+                for packet in parser.feed(chunk):
+                    assert parser.format is not None
+                    writer.write(parser.format, packet)
+                writer.rotate()
+        except SSH_ERROR as e:
+            return Err(e)
+        except PcapError as e:
+            return Err(e)
+        finally:
+            writer.close()
+        return stream.wait()
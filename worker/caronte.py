@@ -1,6 +1,6 @@
 from __future__ import annotations
 from collections.abc import Generator
-from httpx import HTTPStatusError, RequestError, post, TransportError, get
+from httpx import HTTPStatusError, RequestError, TransportError
 from result import Err, Ok, Result
 from worker.config import wait_for_host_ip, NETWORK_ATTEMPTS_INTERVAL, get_config
 from subprocess import Popen
@@ -12,22 +12,22 @@ from contextlib import contextmanager
 from attrs import frozen
 
 from worker.utils import add_sigterm
+from worker.clients import LOCAL_CARONTE_URL, caronte_client, caronte_setup_client
 
 LOGGER = getLogger(__name__)
 
 
 def caronte_check() -> None:
     LOGGER.debug("Healthchecking rules")
-    config = get_config()
-    auth = (config.caronte.username, config.caronte.password)
-    response = get("http://127.0.0.1:3333/api/rules", auth=auth)
+    client = caronte_client(LOCAL_CARONTE_URL)
+    response = client.get("/api/rules")
     if response.status_code != 200:
         LOGGER.warning(
             f"Healthchecking rules failed: status_code={response.status_code} text={response.text}"
         )
     assert response.status_code == 200, response.text
     LOGGER.debug("Halthchecking pcap sessions")
-    response = get("http://127.0.0.1:3333/api/pcap/sessions", auth=auth)
+    response = client.get("/api/pcap/sessions")
     if response.status_code != 200:
         LOGGER.warning(
             f"Healthchecking pcap sessions failed: status_code={response.status_code} text={response.text}"
@@ -55,8 +55,8 @@ class Caronte:
         accounts: dict[str, str],
     ) -> Result[None, RequestError | HTTPStatusError]:
         try:
-            response = post(
-                "http://127.0.0.1:3333/setup",
+            response = caronte_setup_client().post(
+                "/setup",
                 json={
                     "config": {
                         "server_address": server_address,
@@ -123,8 +123,8 @@ def caronte() -> None:
         auth_required = len(config.caronte.username) != 0
         accounts = {config.caronte.username: config.caronte.password}
         try:
-            response = post(
-                "http://127.0.0.1:3333/setup",
+            response = caronte_setup_client().post(
+                "/setup",
                 json={
                     "config": {
                         "server_address": resolved_ip,
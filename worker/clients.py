@@ -0,0 +1,40 @@
+from __future__ import annotations
+from functools import cache
+from httpx import Client, HTTPTransport, Limits, Timeout
+from worker.config import get_config
+
+CARONTE_URL = "http://caronte:3333"
+LOCAL_CARONTE_URL = "http://127.0.0.1:3333"
+LOCAL_FARM_URL = "http://127.0.0.1:5000"
+HTTP_TIMEOUT = Timeout(30, connect=5)
+HTTP_LIMITS = Limits(
+    max_connections=16, max_keepalive_connections=8, keepalive_expiry=60
+)
+HTTP_RETRIES = 3
+
+
+def http_client(base_url: str, auth: tuple[str, str] | None) -> Client:
+    return Client(
+        base_url=base_url,
+        auth=auth,
+        timeout=HTTP_TIMEOUT,
+        limits=HTTP_LIMITS,
+        transport=HTTPTransport(retries=HTTP_RETRIES, limits=HTTP_LIMITS),
+    )
+
+
+@cache
+def caronte_client(base_url: str = CARONTE_URL) -> Client:
+    config = get_config()
+    return http_client(base_url, (config.caronte.username, config.caronte.password))
+
+
+@cache
+def caronte_setup_client(base_url: str = LOCAL_CARONTE_URL) -> Client:
+    return http_client(base_url, None)
+
+
+@cache
+def farm_client(base_url: str = LOCAL_FARM_URL) -> Client:
+    config = get_config()
+    return http_client(base_url, ("admin", config.farm.password))
@@ -1,13 +1,22 @@
 from __future__ import annotations
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Literal, Optional
 from result import Err, Ok, Result
 from toml import load
 from os.path import join
 from httpx import get, HTTPStatusError, RequestError
-from socket import gethostbyname, gaierror
+from socket import gethostbyname, gaierror, socket
 from time import sleep
 from logging import getLogger
-from pydantic import BaseModel, TypeAdapter, ValidationError
+from paramiko import Transport
+from pydantic import (
+    BaseModel,
+    Field,
+    IPvAnyAddress,
+    IPvAnyNetwork,
+    TypeAdapter,
+    ValidationError,
+    model_validator,
+)
 from json import JSONDecodeError
 from worker.utils import no_extra
 
@@ -16,6 +25,12 @@ DATA_FOLDER = join("/", "data")
 UNCOMPRESSED_FOLDER = join(DATA_FOLDER, "uncompressed")
 BACKUP_FOLDER = join(DATA_FOLDER, "backup")
 COMPRESSED_FOLDER = join(DATA_FOLDER, "compressed")
+PARTIAL_FOLDER = join(DATA_FOLDER, "partial")
+REPLAY_FOLDER = join(DATA_FOLDER, "replay")
+JOURNAL_FILE = join(DATA_FOLDER, "journal.sqlite")
+INDEX_FILE = join(DATA_FOLDER, "index.sqlite")
+LEAK_LOG = join(DATA_FOLDER, "leaks.log")
+CAPTURE_SCRIPT = "capture.sh"
 
 GITHUB_KEYS_URL = "https://api.github.com/users/{}/keys"
 
@@ -50,6 +65,21 @@ class Config(BaseModel):
     git: Git
     sshkeys: SSHKeys
     aliases: Dict[str, str]
+    retention: Retention = Field(default_factory=lambda: Retention())
+    filter: Filter = Field(default_factory=lambda: Filter())
+    services: Dict[str, Service] = {}
+    profiles: Dict[str, Profile] = {}
+
+    @model_validator(mode="after")
+    def check_profile(self) -> Config:
+        if self.server.profile is not None and self.server.profile not in self.profiles:
+            raise ValueError(f"Unknown transport profile {self.server.profile}")
+        return self
+
+    def transport_profile(self) -> Profile:
+        if self.server.profile is None:
+            return Profile()
+        return self.profiles[self.server.profile]
 
 
 @no_extra
@@ -68,6 +98,7 @@ class Flag(BaseModel):
 class Caronte(BaseModel):
     username: str
     password: str
+    max_pending_imports: Optional[int] = None
 
 
 @no_extra
@@ -91,12 +122,84 @@ class Server(BaseModel):
     host: str
     port: int
     password: str
+    timeout: int = 10
+    keepalive: int = 5
+    max_backoff: int = 30
+    buffer_size: int = 65536
+    profile: Optional[str] = None
+    game_ip: Optional[str] = None
+
+
+@no_extra
+class Profile(BaseModel):
+    ciphers: Optional[List[str]] = None
+    macs: Optional[List[str]] = None
+    window_size: int = 2097152
+    max_packet_size: int = 32768
+    compress: bool = False
+
+    @model_validator(mode="after")
+    def check_algorithms(self) -> Profile:
+        with socket() as sock:
+            options = Transport(sock).get_security_options()
+        for kind, names, supported in [
+            ("cipher", self.ciphers, options.ciphers),
+            ("mac", self.macs, options.digests),
+        ]:
+            unknown = [name for name in names or [] if name not in supported]
+            if unknown:
+                raise ValueError(
+                    f"Unsupported {kind} {', '.join(unknown)}, choose from {', '.join(supported)}"
+                )
+        return self
 
 
 @no_extra
 class TcpDumper(BaseModel):
     interval: int
     dumps_folder: str
+    capture: Literal["rotate", "stream"] = "rotate"
+    capture_max_size: int = 67108864
+    watch: bool = False
+    stream_download: bool = False
+    pipeline: bool = False
+    queue_size: int = 4
+    download_workers: int = 4
+    prefetch_requests: Optional[int] = None
+    bandwidth_limit: Optional[int] = None
+    adaptive_bandwidth: bool = False
+    extract_workers: Optional[int] = None
+    extract_buffer_size: int = 1048576
+    upload_workers: int = 1
+    merge_size: Optional[int] = None
+    merge_delay: int = 300
+    split_size: Optional[int] = None
+    backup: Literal["move", "compressed"] = "move"
+    index: bool = False
+    detect_leaks: bool = False
+
+
+@no_extra
+class Retention(BaseModel):
+    max_bytes: Optional[int] = None
+    max_age: Optional[int] = None
+    min_free_bytes: Optional[int] = None
+    interval: int = 60
+
+
+@no_extra
+class Filter(BaseModel):
+    drop_ports: List[int] = []
+    drop_hosts: List[IPvAnyAddress] = []
+    drop_subnets: List[IPvAnyNetwork] = []
+    service_ports: List[int] = []
+    max_flow_bytes: Optional[int] = None
+
+
+@no_extra
+class Service(BaseModel):
+    ports: List[int] = []
+    priority: int = 0
 
 
 @no_extra
@@ -3,7 +3,7 @@ from logging import getLogger
 from pydantic import BaseModel
 from os.path import join
 from subprocess import call
-from httpx import get
+from worker.clients import farm_client
 from worker.config import get_config, wait_for_host_ip
 
 
@@ -59,7 +59,7 @@ def destructivefarm() -> None:
 def destructivefarm_check() -> None:
     config = get_config()
     LOGGER.debug("Healthchecking destructive farm login")
-    response = get("http://127.0.0.1:5000", auth=("admin", config.farm.password))
+    response = farm_client().get("/")
     if response.status_code != 200:
         LOGGER.warning(
             f"Healthchecking failed: status_code={response.status_code} text={response.text}"
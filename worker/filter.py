@@ -0,0 +1,135 @@
+from __future__ import annotations
+from collections import Counter
+from ipaddress import IPv4Network, IPv6Network, ip_network
+from typing import BinaryIO
+from attrs import define, field, frozen
+from worker.config import Filter
+from worker.pcap import (
+    READ_SIZE,
+    Flow,
+    Packet,
+    PcapFormat,
+    PcapParser,
+    PcapWriter,
+    decode_packet,
+)
+
+
+@define
+class FilterStats:
+    files: int = 0
+    packets: int = 0
+    bytes: int = 0
+    kept_packets: int = 0
+    kept_bytes: int = 0
+    dropped: Counter[str] = field(factory=Counter[str])
+
+    def add(self, other: FilterStats) -> None:
+        self.files += other.files
+        self.packets += other.packets
+        self.bytes += other.bytes
+        self.kept_packets += other.kept_packets
+        self.kept_bytes += other.kept_bytes
+        self.dropped.update(other.dropped)
+
+    def report(self) -> str:
+        reasons = ", ".join(
+            f"{count} by {reason}" for reason, count in self.dropped.most_common()
+        )
+        return f"kept {self.kept_packets}/{self.packets} packets and {self.kept_bytes}/{self.bytes} bytes of {self.files} pcaps, dropped {reasons or 'none'}"
+
+
+@frozen
+class FilterRules:
+    drop_ports: frozenset[int]
+    drop_networks: tuple[IPv4Network | IPv6Network, ...]
+    service_ports: frozenset[int]
+    max_flow_bytes: int | None
+
+    def active(self) -> bool:
+        return bool(
+            self.drop_ports
+            or self.drop_networks
+            or self.service_ports
+            or self.max_flow_bytes is not None
+        )
+
+
+def filter_rules(config: Filter) -> FilterRules:
+    return FilterRules(
+        frozenset(config.drop_ports),
+        (
+            *(ip_network(host.packed) for host in config.drop_hosts),
+            *config.drop_subnets,
+        ),
+        frozenset(config.service_ports),
+        config.max_flow_bytes,
+    )
+
+
+@define
+class TrafficFilter:
+    rules: FilterRules
+    stats: FilterStats = field(factory=FilterStats)
+    _flows: dict[Flow, int] = field(factory=dict[Flow, int], init=False)
+
+    def verdict(self, format: PcapFormat, packet: Packet) -> str | None:
+        rules = self.rules
+        segment = decode_packet(format, packet)
+        if segment is None:
+            return "protocol"
+        flow = segment.flow
+        if (
+            flow.source_port in rules.drop_ports
+            or flow.destination_port in rules.drop_ports
+        ):
+            return "port"
+        for network in rules.drop_networks:
+            if flow.source in network or flow.destination in network:
+                return "host"
+        if (
+            rules.service_ports
+            and flow.source_port not in rules.service_ports
+            and flow.destination_port not in rules.service_ports
+        ):
+            return "service"
+        if rules.max_flow_bytes is not None and segment.length > 0:
+            key = flow.key()
+            seen = self._flows.get(key, 0)
+            if seen >= rules.max_flow_bytes:
+                return "flow size"
+            self._flows[key] = seen + segment.length
+        return None
+
+    def keep(self, format: PcapFormat, packet: Packet) -> bool:
+        size = len(packet.data)
+        self.stats.packets += 1
+        self.stats.bytes += size
+        reason = self.verdict(format, packet)
+        if reason is not None:
+            self.stats.dropped[reason] += 1
+            return False
+        self.stats.kept_packets += 1
+        self.stats.kept_bytes += size
+        return True
+
+
+def filter_pcap(
+    source: BinaryIO, destination: BinaryIO, rules: FilterRules
+) -> FilterStats:
+    parser = PcapParser()
+    traffic_filter = TrafficFilter(rules)
+    writer: PcapWriter | None = None
+    while chunk := source.read(READ_SIZE):
+        for packet in parser.feed(chunk):
+            assert parser.format is not None
+            if writer is None:
+                writer = PcapWriter(destination, parser.format)
+            if traffic_filter.keep(parser.format, packet):
+                writer.write(packet)
+    parser.close()
+    if writer is None:
+        assert parser.format is not None
+        _ = PcapWriter(destination, parser.format)
+    traffic_filter.stats.files += 1
+    return traffic_filter.stats
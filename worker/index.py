@@ -0,0 +1,297 @@
+from __future__ import annotations
+from os import getpid
+from sqlite3 import Connection, connect
+from threading import Lock
+from typing import BinaryIO
+from logging import getLogger
+from attrs import define, field, frozen
+from worker.config import INDEX_FILE
+from worker.pcap import Flow, decode_packet, read_packets
+from worker.search import SearchHit
+
+LOGGER = getLogger(__name__)
+
+index: Index | None = None
+
+
+@define
+class FlowSummary:
+    flow: Flow
+    first: float
+    last: float
+    first_offset: int
+    last_offset: int
+    packets: int = 0
+    bytes: int = 0
+
+
+@define
+class CaptureSummary:
+    first: float | None = None
+    last: float | None = None
+    packets: int = 0
+    bytes: int = 0
+    flows: dict[Flow, FlowSummary] = field(factory=dict[Flow, FlowSummary])
+
+
+@frozen
+class IndexEntry:
+    file: str
+    protocol: int
+    source: str
+    source_port: int
+    destination: str
+    destination_port: int
+    first: float
+    last: float
+    packets: int
+    bytes: int
+    first_offset: int
+    last_offset: int
+
+
+def summarize_pcap(source: BinaryIO) -> CaptureSummary:
+    summary = CaptureSummary()
+    for format, packet in read_packets(source):
+        timestamp = format.timestamp(packet)
+        size = len(packet.data)
+        if summary.first is None:
+            summary.first = timestamp
+        summary.last = timestamp
+        summary.packets += 1
+        summary.bytes += size
+        segment = decode_packet(format, packet)
+        if segment is None:
+            continue
+        key = segment.flow.key()
+        flow = summary.flows.get(key)
+        if flow is None:
+            flow = summary.flows[key] = FlowSummary(
+                segment.flow, timestamp, timestamp, packet.offset, packet.offset
+            )
+        flow.last = timestamp
+        flow.last_offset = packet.offset
+        flow.packets += 1
+        flow.bytes += size
+    return summary
+
+
+@frozen
+class Index:
+    _connection: Connection
+    pid: int = field(factory=getpid)
+    _lock: Lock = field(factory=Lock)
+
+    def add(self, name: str, summary: CaptureSummary) -> None:
+        LOGGER.debug(f"Indexing {len(summary.flows)} flows of {name}")
+        with self._lock, self._connection:
+            _ = self._connection.execute("DELETE FROM flows WHERE file = ?", (name,))
+            _ = self._connection.execute(
+                "INSERT OR REPLACE INTO files (name, first, last, packets, bytes) VALUES (?, ?, ?, ?, ?)",
+                (name, summary.first, summary.last, summary.packets, summary.bytes),
+            )
+            _ = self._connection.executemany(
+                """INSERT INTO flows (
+                    file, protocol, source, source_port, destination, destination_port,
+                    first, last, packets, bytes, first_offset, last_offset
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    (
+                        name,
+                        flow.flow.protocol,
+                        str(flow.flow.source),
+                        flow.flow.source_port,
+                        str(flow.flow.destination),
+                        flow.flow.destination_port,
+                        flow.first,
+                        flow.last,
+                        flow.packets,
+                        flow.bytes,
+                        flow.first_offset,
+                        flow.last_offset,
+                    )
+                    for flow in summary.flows.values()
+                ),
+            )
+
+    def remove(self, name: str) -> None:
+        LOGGER.debug(f"Removing {name} from the index")
+        with self._lock, self._connection:
+            _ = self._connection.execute("DELETE FROM flows WHERE file = ?", (name,))
+            _ = self._connection.execute("DELETE FROM files WHERE name = ?", (name,))
+            _ = self._connection.execute("DELETE FROM searches WHERE file = ?", (name,))
+            _ = self._connection.execute(
+                "DELETE FROM search_hits WHERE file = ?", (name,)
+            )
+
+    def spans(self) -> dict[str, tuple[float | None, float | None]]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT name, first, last FROM files"
+            ).fetchall()
+        return {name: (first, last) for name, first, last in rows}
+
+    def files_with_ports(self, ports: list[int]) -> set[str]:
+        marks = ", ".join("?" for _ in ports)
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT DISTINCT file FROM flows WHERE source_port IN ({marks}) OR destination_port IN ({marks})",
+                (*ports, *ports),
+            ).fetchall()
+        return {name for name, in rows}
+
+    def cached_hits(
+        self, name: str, key: str, size: int, mtime: float
+    ) -> list[SearchHit] | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT size, mtime FROM searches WHERE file = ? AND key = ?",
+                (name, key),
+            ).fetchone()
+            if row != (size, mtime):
+                return None
+            rows = self._connection.execute(
+                """SELECT file, offset, timestamp, match, protocol, source, source_port,
+                    destination, destination_port
+                FROM search_hits WHERE file = ? AND key = ? ORDER BY offset""",
+                (name, key),
+            ).fetchall()
+        return [SearchHit(*row) for row in rows]
+
+    def cache_hits(
+        self, name: str, key: str, size: int, mtime: float, hits: list[SearchHit]
+    ) -> None:
+        with self._lock, self._connection:
+            _ = self._connection.execute(
+                "DELETE FROM search_hits WHERE file = ? AND key = ?", (name, key)
+            )
+            _ = self._connection.execute(
+                "INSERT OR REPLACE INTO searches (file, key, size, mtime) VALUES (?, ?, ?, ?)",
+                (name, key, size, mtime),
+            )
+            _ = self._connection.executemany(
+                """INSERT INTO search_hits (
+                    key, file, offset, timestamp, match, protocol, source, source_port,
+                    destination, destination_port
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    (
+                        key,
+                        hit.file,
+                        hit.offset,
+                        hit.timestamp,
+                        hit.match,
+                        hit.protocol,
+                        hit.source,
+                        hit.source_port,
+                        hit.destination,
+                        hit.destination_port,
+                    )
+                    for hit in hits
+                ),
+            )
+
+    def query(
+        self,
+        start: float | None = None,
+        end: float | None = None,
+        host: str | None = None,
+        port: int | None = None,
+        limit: int | None = None,
+    ) -> list[IndexEntry]:
+        conditions: list[str] = []
+        parameters: list[str | int | float] = []
+        if start is not None:
+            conditions.append("last >= ?")
+            parameters.append(start)
+        if end is not None:
+            conditions.append("first <= ?")
+            parameters.append(end)
+        if host is not None:
+            conditions.append("(source = ? OR destination = ?)")
+            parameters.extend([host, host])
+        if port is not None:
+            conditions.append("(source_port = ? OR destination_port = ?)")
+            parameters.extend([port, port])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._connection.execute(
+                f"""SELECT file, protocol, source, source_port, destination, destination_port,
+                    first, last, packets, bytes, first_offset, last_offset
+                FROM flows {where} ORDER BY first LIMIT ?""",
+                (*parameters, -1 if limit is None else limit),
+            ).fetchall()
+        return [IndexEntry(*row) for row in rows]
+
+
+def open_index(path: str = INDEX_FILE) -> Index:
+    connection = connect(path, check_same_thread=False)
+    _ = connection.execute("PRAGMA journal_mode = WAL")
+    _ = connection.execute("PRAGMA synchronous = NORMAL")
+    _ = connection.execute(
+        """CREATE TABLE IF NOT EXISTS files (
+            name TEXT PRIMARY KEY,
+            first REAL,
+            last REAL,
+            packets INTEGER NOT NULL,
+            bytes INTEGER NOT NULL
+        )"""
+    )
+    _ = connection.execute(
+        """CREATE TABLE IF NOT EXISTS flows (
+            file TEXT NOT NULL,
+            protocol INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            source_port INTEGER NOT NULL,
+            destination TEXT NOT NULL,
+            destination_port INTEGER NOT NULL,
+            first REAL NOT NULL,
+            last REAL NOT NULL,
+            packets INTEGER NOT NULL,
+            bytes INTEGER NOT NULL,
+            first_offset INTEGER NOT NULL,
+            last_offset INTEGER NOT NULL
+        )"""
+    )
+    _ = connection.execute(
+        """CREATE TABLE IF NOT EXISTS searches (
+            file TEXT NOT NULL,
+            key TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            PRIMARY KEY (file, key)
+        )"""
+    )
+    _ = connection.execute(
+        """CREATE TABLE IF NOT EXISTS search_hits (
+            key TEXT NOT NULL,
+            file TEXT NOT NULL,
+            offset INTEGER NOT NULL,
+            timestamp REAL NOT NULL,
+            match TEXT NOT NULL,
+            protocol INTEGER,
+            source TEXT,
+            source_port INTEGER,
+            destination TEXT,
+            destination_port INTEGER
+        )"""
+    )
+    _ = connection.execute(
+        "CREATE INDEX IF NOT EXISTS search_hits_file ON search_hits (file, key)"
+    )
+    for column in ["file", "first"]:
+        _ = connection.execute(
+            f"CREATE INDEX IF NOT EXISTS flows_{column} ON flows ({column})"
+        )
+    for column in ["source", "source_port", "destination", "destination_port"]:
+        _ = connection.execute(
+            f"CREATE INDEX IF NOT EXISTS flows_{column} ON flows ({column}, first)"
+        )
+    return Index(connection)
+
+
+def get_index() -> Index:
+    global index
+    if index is None or index.pid != getpid():
+        index = open_index()
+    return index
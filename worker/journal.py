@@ -0,0 +1,95 @@
+from __future__ import annotations
+from os import getpid
+from sqlite3 import Connection, connect
+from threading import Lock
+from time import time
+from typing import Literal
+from logging import getLogger
+from attrs import field, frozen
+from worker.config import JOURNAL_FILE
+
+LOGGER = getLogger(__name__)
+
+Stage = Literal["downloaded", "extracted", "submitted", "backed_up"]
+
+journal: Journal | None = None
+
+
+@frozen
+class JournalEntry:
+    name: str
+    stage: Stage
+    checksum: str | None
+    size: int | None
+    mtime: int | None
+
+
+@frozen
+class Journal:
+    _connection: Connection
+    pid: int = field(factory=getpid)
+    _lock: Lock = field(factory=Lock)
+
+    def get(self, name: str) -> JournalEntry | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT name, stage, checksum, size, mtime FROM captures WHERE name = ?",
+                (name,),
+            ).fetchone()
+        return None if row is None else JournalEntry(*row)
+
+    def record(
+        self,
+        name: str,
+        stage: Stage,
+        checksum: str | None = None,
+        size: int | None = None,
+        mtime: int | None = None,
+    ) -> None:
+        LOGGER.debug(f"Journaling {name} as {stage}")
+        with self._lock, self._connection:
+            _ = self._connection.execute(
+                """INSERT INTO captures (name, stage, checksum, size, mtime, updated)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET
+                    stage = excluded.stage,
+                    checksum = coalesce(excluded.checksum, checksum),
+                    size = coalesce(excluded.size, size),
+                    mtime = coalesce(excluded.mtime, mtime),
+                    updated = excluded.updated""",
+                (name, stage, checksum, size, mtime, time()),
+            )
+
+    def reset(
+        self, name: str, stage: Stage, checksum: str, size: int, mtime: int
+    ) -> None:
+        LOGGER.debug(f"Journaling new capture {name}")
+        with self._lock, self._connection:
+            _ = self._connection.execute(
+                "INSERT OR REPLACE INTO captures (name, stage, checksum, size, mtime, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (name, stage, checksum, size, mtime, time()),
+            )
+
+
+def open_journal(path: str = JOURNAL_FILE) -> Journal:
+    connection = connect(path, check_same_thread=False)
+    _ = connection.execute("PRAGMA journal_mode = WAL")
+    _ = connection.execute("PRAGMA synchronous = NORMAL")
+    _ = connection.execute(
+        """CREATE TABLE IF NOT EXISTS captures (
+            name TEXT PRIMARY KEY,
+            stage TEXT NOT NULL,
+            checksum TEXT,
+            size INTEGER,
+            mtime INTEGER,
+            updated REAL NOT NULL
+        )"""
+    )
+    return Journal(connection)
+
+
+def get_journal() -> Journal:
+    global journal
+    if journal is None or journal.pid != getpid():
+        journal = open_journal()
+    return journal
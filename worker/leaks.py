@@ -0,0 +1,149 @@
+from __future__ import annotations
+from collections import Counter
+from ipaddress import ip_address
+from re import Pattern, compile
+from time import localtime, strftime
+from logging import getLogger
+from attrs import define, field
+from result import Ok
+from worker.config import LEAK_LOG, get_config, getaddrinfo
+from worker.pcap import (
+    PROTOCOL_TCP,
+    Flow,
+    IPAddress,
+    Packet,
+    PcapError,
+    PcapFormat,
+    PcapParser,
+    decode_packet,
+)
+from worker.services import OTHER_SERVICE, service_ports
+
+LOGGER = getLogger(__name__)
+LEAK_WINDOW = 256
+TCP_FIN = 0x01
+TCP_RST = 0x04
+SEQUENCE_MODULO = 1 << 32
+
+
+@define
+class StreamState:
+    next: int
+    tail: bytes = b""
+
+
+@define
+class LeakDetector:
+    name: str
+    regex: Pattern[bytes]
+    vulnbox: IPAddress | None
+    ports: dict[int, str]
+    log_file: str | None = LEAK_LOG
+    leaks: Counter[str] = field(factory=Counter[str])
+    _parser: PcapParser = field(factory=PcapParser, init=False)
+    _streams: dict[Flow, StreamState] = field(factory=dict[Flow, StreamState], init=False)
+    _failed: bool = field(default=False, init=False)
+
+    def feed(self, chunk: bytes) -> None:
+        if self._failed:
+            return
+        try:
+            packets = self._parser.feed(chunk)
+        except PcapError as e:
+            LOGGER.warning(f"Stopping the leak detection of {self.name}: {e}")
+            self._failed = True
+            return
+        for packet in packets:
+            assert self._parser.format is not None
+            self.packet(self._parser.format, packet)
+
+    def packet(self, format: PcapFormat, packet: Packet) -> None:
+        segment = decode_packet(format, packet)
+        if segment is None:
+            return
+        flow = segment.flow
+        if self.vulnbox is not None and flow.source != self.vulnbox:
+            return
+        payload = packet.data[segment.start : segment.end]
+        tail = b""
+        if flow.protocol == PROTOCOL_TCP:
+            state = self._streams.get(flow)
+            if state is not None:
+                delta = (segment.sequence - state.next) % SEQUENCE_MODULO
+                if delta == 0:
+                    tail = state.tail
+                elif delta >= SEQUENCE_MODULO // 2:
+                    overlap = SEQUENCE_MODULO - delta
+                    if overlap >= len(payload):
+                        return
+                    payload = payload[overlap:]
+                    tail = state.tail
+            if segment.flags & (TCP_FIN | TCP_RST):
+                _ = self._streams.pop(flow, None)
+            elif payload:
+                self._streams[flow] = StreamState(
+                    (segment.sequence + segment.length) % SEQUENCE_MODULO,
+                    (tail + payload)[-LEAK_WINDOW:],
+                )
+        if not payload:
+            return
+        data = tail + payload
+        for match in self.regex.finditer(data):
+            if match.end() > len(tail):
+                self.leak(format.timestamp(packet), flow, match.group())
+
+    def leak(self, timestamp: float, flow: Flow, flag: bytes) -> None:
+        service = self.ports.get(flow.source_port, OTHER_SERVICE)
+        self.leaks[service] += 1
+        alert = f"{strftime('%H:%M:%S', localtime(timestamp))} {self.name} {service} {flow.source}:{flow.source_port} -> {flow.destination}:{flow.destination_port} {flag.decode(errors='replace')}"
+        LOGGER.warning(f"Flag leak: {alert}")
+        if self.log_file is None:
+            return
+        try:
+            with open(self.log_file, "a") as file:
+                _ = file.write(f"{alert}\n")
+        except OSError as e:
+            LOGGER.error(f"Error writing the flag leak alert log: {e}")
+
+
+def vulnbox_address() -> IPAddress | None:
+    config = get_config()
+    host = config.server.game_ip or config.server.host
+    try:
+        return ip_address(host)
+    except ValueError:
+        pass
+    result = getaddrinfo(host)
+    if isinstance(result, Ok):
+        return ip_address(result.ok_value)
+    LOGGER.warning(f"Scanning for leaks the payloads of every host: {result.err_value}")
+    return None
+
+
+def leak_detector(name: str) -> LeakDetector | None:
+    config = get_config()
+    if not config.tcpdumper.detect_leaks:
+        return None
+    return LeakDetector(
+        name,
+        compile(config.flag.format.encode()),
+        vulnbox_address(),
+        service_ports(),
+    )
+
+
+@define
+class LeakStats:
+    leaks: Counter[str] = field(factory=Counter[str])
+
+    def add(self, name: str, leaks: Counter[str]) -> None:
+        self.leaks.update(leaks)
+        if leaks:
+            LOGGER.warning(
+                f"Found {sum(leaks.values())} flag leaks in {name}, {self.report()} in total"
+            )
+
+    def report(self) -> str:
+        return ", ".join(
+            f"{count} of {service}" for service, count in self.leaks.most_common()
+        )
@@ -0,0 +1,342 @@
+from __future__ import annotations
+from collections.abc import Callable, Generator
+from functools import lru_cache
+from ipaddress import IPv4Address, IPv6Address, ip_address
+from shutil import copyfileobj
+from struct import Struct, error as StructError
+from typing import BinaryIO
+from attrs import define, field, frozen
+
+MAGIC_MICROSECONDS = 0xA1B2C3D4
+MAGIC_NANOSECONDS = 0xA1B23C4D
+GLOBAL_HEADER_SIZE = 24
+RECORD_HEADER_SIZE = 16
+MAX_PACKET_SIZE = 262144
+READ_SIZE = 1 << 20
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = (101, 228, 229)
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LINUX_SLL2 = 276
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_VLAN = (0x8100, 0x88A8)
+IPV6_EXTENSION_HEADERS = (0, 43, 60)
+PROTOCOL_TCP = 6
+PROTOCOL_UDP = 17
+PROTOCOL_NAMES = {PROTOCOL_TCP: "tcp", PROTOCOL_UDP: "udp"}
+PORTS = Struct(">HH")
+TCP_HEADER = Struct(">HHI")
+UINT16 = Struct(">H")
+
+IPAddress = IPv4Address | IPv6Address
+
+
+class PcapError(Exception):
+    ...
+
+
+@frozen
+class Packet:
+    seconds: int
+    fraction: int
+    original_length: int
+    data: bytes
+    offset: int = 0
+
+
+@frozen
+class Flow:
+    protocol: int
+    source: IPAddress
+    source_port: int
+    destination: IPAddress
+    destination_port: int
+
+    def reversed(self) -> Flow:
+        return Flow(
+            self.protocol,
+            self.destination,
+            self.destination_port,
+            self.source,
+            self.source_port,
+        )
+
+    def key(self) -> Flow:
+        other = self.reversed()
+        if (self.source.packed, self.source_port) <= (
+            other.source.packed,
+            other.source_port,
+        ):
+            return self
+        return other
+
+
+@frozen
+class Segment:
+    flow: Flow
+    start: int
+    end: int
+    sequence: int = 0
+    flags: int = 0
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start
+
+
+@frozen
+class PcapFormat:
+    endianness: str
+    nanoseconds: bool
+    snaplen: int
+    linktype: int
+    header: bytes
+    record: Struct
+
+    def timestamp(self, packet: Packet) -> float:
+        return packet.seconds + packet.fraction / (1e9 if self.nanoseconds else 1e6)
+
+    def pack(self, packet: Packet) -> bytes:
+        return self.record.pack(
+            packet.seconds, packet.fraction, len(packet.data), packet.original_length
+        )
+
+
+@lru_cache(maxsize=65536)
+def parse_address(raw: bytes) -> IPAddress:
+    return ip_address(raw)
+
+
+def network_offset(linktype: int, data: bytes) -> int | None:
+    if linktype == LINKTYPE_ETHERNET:
+        offset = 12
+        while len(data) >= offset + 2:
+            (ethertype,) = UINT16.unpack_from(data, offset)
+            if ethertype in ETHERTYPE_VLAN:
+                offset += 4
+                continue
+            if ethertype in (ETHERTYPE_IPV4, ETHERTYPE_IPV6):
+                return offset + 2
+            return None
+        return None
+    if linktype in LINKTYPE_RAW:
+        return 0
+    if linktype == LINKTYPE_LINUX_SLL:
+        return 16
+    if linktype == LINKTYPE_LINUX_SLL2:
+        return 20
+    if linktype == LINKTYPE_NULL:
+        return 4
+    return None
+
+
+def decode_packet(format: PcapFormat, packet: Packet) -> Segment | None:
+    data = packet.data
+    offset = network_offset(format.linktype, data)
+    if offset is None or len(data) <= offset:
+        return None
+    version = data[offset] >> 4
+    if version == 4:
+        header_length = (data[offset] & 0x0F) * 4
+        if len(data) < offset + max(header_length, 20):
+            return None
+        (total_length,) = UINT16.unpack_from(data, offset + 2)
+        (fragment,) = UINT16.unpack_from(data, offset + 6)
+        if fragment & 0x1FFF:
+            return None
+        protocol = data[offset + 9]
+        source = data[offset + 12 : offset + 16]
+        destination = data[offset + 16 : offset + 20]
+        end = min(offset + total_length, len(data))
+        transport = offset + header_length
+    elif version == 6:
+        if len(data) < offset + 40:
+            return None
+        (payload_length,) = UINT16.unpack_from(data, offset + 4)
+        protocol = data[offset + 6]
+        source = data[offset + 8 : offset + 24]
+        destination = data[offset + 24 : offset + 40]
+        end = min(offset + 40 + payload_length, len(data))
+        transport = offset + 40
+        while protocol in IPV6_EXTENSION_HEADERS and transport + 2 <= end:
+            protocol = data[transport]
+            transport += (data[transport + 1] + 1) * 8
+    else:
+        return None
+    if protocol == PROTOCOL_TCP and transport + 20 <= end:
+        source_port, destination_port, sequence = TCP_HEADER.unpack_from(
+            data, transport
+        )
+        start = transport + (data[transport + 12] >> 4) * 4
+        flags = data[transport + 13]
+    elif protocol == PROTOCOL_UDP and transport + 8 <= end:
+        source_port, destination_port = PORTS.unpack_from(data, transport)
+        start = transport + 8
+        sequence = flags = 0
+    else:
+        return None
+    flow = Flow(
+        protocol,
+        parse_address(source),
+        source_port,
+        parse_address(destination),
+        destination_port,
+    )
+    return Segment(flow, min(start, end), end, sequence, flags)
+
+
+def parse_header(header: bytes) -> PcapFormat:
+    if len(header) < GLOBAL_HEADER_SIZE:
+        raise PcapError("Truncated pcap header")
+    for endianness in "<>":
+        try:
+            magic, _, _, _, _, snaplen, linktype = Struct(
+                f"{endianness}IHHiIII"
+            ).unpack_from(header)
+        except StructError as e:
+            raise PcapError(e) from e
+        if magic in (MAGIC_MICROSECONDS, MAGIC_NANOSECONDS):
+            return PcapFormat(
+                endianness,
+                magic == MAGIC_NANOSECONDS,
+                snaplen,
+                linktype,
+                bytes(header[:GLOBAL_HEADER_SIZE]),
+                Struct(f"{endianness}IIII"),
+            )
+    raise PcapError("Invalid pcap magic number")
+
+
+@define
+class PcapParser:
+    format: PcapFormat | None = field(default=None, init=False)
+    _buffer: bytearray = field(factory=bytearray, init=False)
+    _offset: int = field(default=0, init=False)
+
+    def feed(self, chunk: bytes) -> list[Packet]:
+        buffer = self._buffer
+        buffer += chunk
+        position = 0
+        if self.format is None:
+            if len(buffer) < GLOBAL_HEADER_SIZE:
+                return []
+            self.format = parse_header(bytes(buffer[:GLOBAL_HEADER_SIZE]))
+            position = GLOBAL_HEADER_SIZE
+        record = self.format.record
+        max_size = max(self.format.snaplen, MAX_PACKET_SIZE)
+        packets: list[Packet] = []
+        while len(buffer) - position >= RECORD_HEADER_SIZE:
+            seconds, fraction, length, original_length = record.unpack_from(
+                buffer, position
+            )
+            if length > max_size:
+                raise PcapError(f"Invalid packet length {length}")
+            start = position + RECORD_HEADER_SIZE
+            end = start + length
+            if end > len(buffer):
+                break
+            packets.append(
+                Packet(
+                    seconds,
+                    fraction,
+                    original_length,
+                    bytes(buffer[start:end]),
+                    self._offset + position,
+                )
+            )
+            position = end
+        del buffer[:position]
+        self._offset += position
+        return packets
+
+    def close(self) -> None:
+        if self.format is None or self._buffer:
+            raise PcapError("Truncated pcap file")
+
+
+def read_packets(file: BinaryIO) -> Generator[tuple[PcapFormat, Packet], None, None]:
+    parser = PcapParser()
+    while chunk := file.read(READ_SIZE):
+        for packet in parser.feed(chunk):
+            assert parser.format is not None
+            yield parser.format, packet
+    parser.close()
+
+
+@define
+class PcapWriter:
+    _file: BinaryIO
+    format: PcapFormat
+    size: int = field(default=GLOBAL_HEADER_SIZE, init=False)
+    packets: int = field(default=0, init=False)
+
+    def __attrs_post_init__(self) -> None:
+        _ = self._file.write(self.format.header)
+
+    def write(self, packet: Packet) -> None:
+        _ = self._file.write(self.format.pack(packet))
+        _ = self._file.write(packet.data)
+        self.size += RECORD_HEADER_SIZE + len(packet.data)
+        self.packets += 1
+
+
+def merge_pcaps(sources: list[BinaryIO], destination: BinaryIO) -> None:
+    header: bytes | None = None
+    for source in sources:
+        current = source.read(GLOBAL_HEADER_SIZE)
+        _ = parse_header(current)
+        if header is None:
+            header = current
+            _ = destination.write(header)
+        elif current != header:
+            raise PcapError("Incompatible pcap headers")
+        copyfileobj(source, destination, READ_SIZE)
+
+
+def split_pcap(
+    source: BinaryIO, max_size: int, open_part: Callable[[int], BinaryIO]
+) -> int:
+    file: BinaryIO | None = None
+    writer: PcapWriter | None = None
+    parts = 0
+    try:
+        for format, packet in read_packets(source):
+            if (
+                writer is not None
+                and writer.packets > 0
+                and writer.size + RECORD_HEADER_SIZE + len(packet.data) > max_size
+            ):
+                writer = None
+            if writer is None:
+                if file is not None:
+                    file.close()
+                file = open_part(parts)
+                writer = PcapWriter(file, format)
+                parts += 1
+            writer.write(packet)
+    finally:
+        if file is not None:
+            file.close()
+    return parts
+
+
+def demux_pcap(
+    source: BinaryIO,
+    classify: Callable[[PcapFormat, Packet], str],
+    open_part: Callable[[str], BinaryIO],
+) -> dict[str, int]:
+    files: dict[str, BinaryIO] = {}
+    writers: dict[str, PcapWriter] = {}
+    try:
+        for format, packet in read_packets(source):
+            key = classify(format, packet)
+            writer = writers.get(key)
+            if writer is None:
+                files[key] = open_part(key)
+                writer = writers[key] = PcapWriter(files[key], format)
+            writer.write(packet)
+    finally:
+        for file in files.values():
+            file.close()
+    return {key: writer.packets for key, writer in writers.items()}
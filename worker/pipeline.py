@@ -0,0 +1,93 @@
+from __future__ import annotations
+from collections.abc import Callable, Hashable, Iterable
+from queue import Queue
+from threading import Lock, Thread, Timer
+from typing import Any
+from logging import getLogger
+from attrs import field, frozen
+
+LOGGER = getLogger(__name__)
+RETRY_INTERVAL = 1
+MAX_ATTEMPTS = 5
+
+
+@frozen
+class Stage:
+    name: str
+    function: Callable[[Any], Iterable[Any]]
+    workers: int = 1
+
+
+@frozen
+class Pipeline:
+    _stages: list[Stage]
+    _queues: list[Queue[tuple[Any, Hashable | None, int]]]
+    _keys: set[Hashable] = field(factory=set[Hashable], init=False)
+    _lock: Lock = field(factory=Lock, init=False)
+
+    def put(self, item: Any, stage: int = 0, key: Hashable | None = None) -> bool:
+        if key is not None:
+            with self._lock:
+                if key in self._keys:
+                    return False
+                self._keys.add(key)
+        self._queues[stage].put((item, key, 0))
+        return True
+
+    def join(self, stages: int | None = None) -> None:
+        for queue in self._queues[:stages]:
+            queue.join()
+
+    def start(self) -> None:
+        for index, stage in enumerate(self._stages):
+            for number in range(stage.workers):
+                LOGGER.debug(f"Starting {stage.name} worker {number}")
+                Thread(
+                    target=self._run,
+                    args=(index,),
+                    name=f"{stage.name}-{number}",
+                    daemon=True,
+                ).start()
+
+    def _run(self, index: int) -> None:
+        stage = self._stages[index]
+        queue = self._queues[index]
+        while True:
+            item, key, failures = queue.get()
+            try:
+                for output in stage.function(item):
+                    if index + 1 < len(self._queues):
+                        self._queues[index + 1].put((output, None, 0))
+            except Exception:
+                failures += 1
+                if failures < MAX_ATTEMPTS:
+                    backoff = RETRY_INTERVAL * 2 ** (failures - 1)
+                    LOGGER.exception(
+                        f"Stage {stage.name} failed processing {item}, retrying in {backoff} seconds"
+                    )
+                    timer = Timer(backoff, self._retry, (index, item, key, failures))
+                    timer.daemon = True
+                    timer.start()
+                    continue
+                LOGGER.exception(
+                    f"Stage {stage.name} failed processing {item} {failures} times, dropping it"
+                )
+            self._done(index, key)
+
+    def _retry(
+        self, index: int, item: Any, key: Hashable | None, failures: int
+    ) -> None:
+        self._queues[index].put((item, key, failures))
+        self._queues[index].task_done()
+
+    def _done(self, index: int, key: Hashable | None) -> None:
+        if key is not None:
+            with self._lock:
+                self._keys.discard(key)
+        self._queues[index].task_done()
+
+
+def start_pipeline(stages: list[Stage], queue_size: int) -> Pipeline:
+    pipeline = Pipeline(stages, [Queue(queue_size) for _ in stages])
+    pipeline.start()
+    return pipeline
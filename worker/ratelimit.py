@@ -0,0 +1,89 @@
+from __future__ import annotations
+from threading import Lock
+from time import monotonic, sleep
+from logging import getLogger
+from attrs import define, field
+from worker.config import get_config
+
+LOGGER = getLogger(__name__)
+RATE_WINDOW = 1
+RTT_INTERVAL = 2
+RTT_TOLERANCE = 2
+RTT_SLACK = 0.01
+MIN_RATE_FRACTION = 16
+
+limiter: RateLimiter | None = None
+
+
+@define
+class RateLimiter:
+    limit: float | None
+    adaptive: bool = False
+    rate: float | None = field(init=False)
+    measured: float = field(default=0, init=False)
+    _tokens: float = field(default=0, init=False)
+    _updated: float = field(factory=monotonic, init=False)
+    _window_start: float = field(factory=monotonic, init=False)
+    _window_bytes: int = field(default=0, init=False)
+    _base_rtt: float | None = field(default=None, init=False)
+    _rtt_checked: float = field(factory=monotonic, init=False)
+    _lock: Lock = field(factory=Lock, init=False)
+
+    def __attrs_post_init__(self) -> None:
+        self.rate = self.limit
+        self._tokens = self.limit or 0
+
+    def acquire(self, size: int) -> None:
+        with self._lock:
+            now = monotonic()
+            self._window_bytes += size
+            if now - self._window_start >= RATE_WINDOW:
+                self.measured = self._window_bytes / (now - self._window_start)
+                self._window_start = now
+                self._window_bytes = 0
+            if self.rate is None:
+                return
+            self._tokens = min(
+                self.rate, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= size
+            delay = -self._tokens / self.rate
+        if delay > 0:
+            sleep(delay)
+
+    def rtt_due(self) -> bool:
+        if not self.adaptive or self.limit is None:
+            return False
+        with self._lock:
+            now = monotonic()
+            if now - self._rtt_checked < RTT_INTERVAL:
+                return False
+            self._rtt_checked = now
+            return True
+
+    def observe_rtt(self, rtt: float) -> None:
+        if self.limit is None or self.rate is None:
+            return
+        with self._lock:
+            if self._base_rtt is None or rtt < self._base_rtt:
+                self._base_rtt = rtt
+            if rtt > self._base_rtt * RTT_TOLERANCE + RTT_SLACK:
+                rate = max(self.rate / 2, self.limit / MIN_RATE_FRACTION)
+            else:
+                rate = min(self.rate + self.limit / MIN_RATE_FRACTION, self.limit)
+            changed, self.rate = rate != self.rate, rate
+        if changed:
+            LOGGER.debug(
+                f"Transfer rate limit set to {rate / 1e6:.2f} MB/s with a round trip of {rtt * 1000:.1f} ms"
+            )
+
+
+def get_limiter() -> RateLimiter:
+    global limiter
+    if limiter is None:
+        config = get_config()
+        limiter = RateLimiter(
+            config.tcpdumper.bandwidth_limit, config.tcpdumper.adaptive_bandwidth
+        )
+    return limiter
@@ -0,0 +1,103 @@
+from __future__ import annotations
+from os import listdir, remove, stat
+from os.path import basename, join
+from shutil import disk_usage
+from sqlite3 import Error as SQLiteError
+from threading import Thread
+from time import sleep, time
+from logging import getLogger
+from attrs import define
+from worker.config import (
+    BACKUP_FOLDER,
+    COMPRESSED_FOLDER,
+    DATA_FOLDER,
+    PARTIAL_FOLDER,
+    REPLAY_FOLDER,
+    UNCOMPRESSED_FOLDER,
+    get_config,
+)
+from worker.index import get_index
+
+LOGGER = getLogger(__name__)
+STAGING_FOLDERS = [
+    COMPRESSED_FOLDER,
+    UNCOMPRESSED_FOLDER,
+    PARTIAL_FOLDER,
+    REPLAY_FOLDER,
+]
+
+
+@define
+class RetentionStats:
+    evicted_files: int = 0
+    evicted_bytes: int = 0
+
+
+def folder_files(folder: str) -> list[tuple[float, int, str]]:
+    files: list[tuple[float, int, str]] = []
+    for name in listdir(folder):
+        path = join(folder, name)
+        try:
+            info = stat(path)
+        except FileNotFoundError:
+            continue
+        files.append((info.st_mtime, info.st_size, path))
+    return files
+
+
+def enforce_retention(stats: RetentionStats) -> None:
+    config = get_config().retention
+    backups = sorted(folder_files(BACKUP_FOLDER))
+    staging = sum(
+        size for folder in STAGING_FOLDERS for _, size, _ in folder_files(folder)
+    )
+    total = staging + sum(size for _, size, _ in backups)
+    free = disk_usage(DATA_FOLDER).free
+    now = time()
+    evicted = 0
+    for mtime, size, path in backups:
+        if not (
+            (config.max_bytes is not None and total > config.max_bytes)
+            or (config.max_age is not None and now - mtime > config.max_age)
+            or (config.min_free_bytes is not None and free < config.min_free_bytes)
+        ):
+            break
+        LOGGER.debug(f"Evicting backup {path}")
+        try:
+            remove(path)
+        except FileNotFoundError:
+            continue
+        try:
+            get_index().remove(basename(path))
+        except SQLiteError as e:
+            LOGGER.error(f"Error removing {basename(path)} from the index: {e}")
+        total -= size
+        free += size
+        evicted += 1
+        stats.evicted_files += 1
+        stats.evicted_bytes += size
+    LOGGER.info(
+        f"Retention: {total} bytes stored, {free} bytes free, {evicted} backups evicted now, {stats.evicted_files} backups ({stats.evicted_bytes} bytes) evicted in total"
+    )
+    if config.max_bytes is not None and total > config.max_bytes:
+        LOGGER.warning(
+            f"Stored pcaps exceed the retention budget with no backups left to evict"
+        )
+    if config.min_free_bytes is not None and free < config.min_free_bytes:
+        LOGGER.warning(f"Only {free} bytes free on the pcap volume")
+
+
+def retention_loop() -> None:
+    config = get_config()
+    stats = RetentionStats()
+    while True:
+        try:
+            enforce_retention(stats)
+        except OSError as e:
+            LOGGER.error(f"Error enforcing the retention policy: {e}")
+        sleep(config.retention.interval)
+
+
+def start_retention() -> None:
+    LOGGER.debug("Starting retention thread")
+    Thread(target=retention_loop, name="retention", daemon=True).start()
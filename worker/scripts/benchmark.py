@@ -0,0 +1,53 @@
+from __future__ import annotations
+from statistics import median
+from time import perf_counter
+from typing import Annotated, Optional
+
+from typer import Option
+from worker.config import Profile, get_config
+from worker.ssh import ssh_connect
+
+BENCHMARK_FILE = ".worker-benchmark"
+
+
+def benchmark(
+    ip: Annotated[
+        Optional[str], Option(help="Override the ip found in the config file")
+    ] = None,
+    port: Annotated[
+        Optional[int], Option(help="Override the port found in the config file")
+    ] = None,
+    runs: Annotated[int, Option(help="Number of commands to execute")] = 20,
+    transfer_size: Annotated[
+        int, Option(help="Bytes downloaded with each transport profile")
+    ] = 33554432,
+):
+    """Measure the round trip latency and the download throughput of the vulnbox"""
+    config = get_config()
+    with ssh_connect(ip, port) as result:
+        ssh = result.unwrap()
+        timings: list[float] = []
+        for _ in range(runs):
+            start = perf_counter()
+            ssh.check_call("true").unwrap()
+            timings.append((perf_counter() - start) * 1000)
+        ssh.check_call(
+            f"head -c {transfer_size} /dev/urandom > {BENCHMARK_FILE}"
+        ).unwrap()
+    print(
+        f"Command round trip over {runs} runs: min {min(timings):.1f} ms, median {median(timings):.1f} ms, max {max(timings):.1f} ms"
+    )
+    profiles = {"default": Profile(), **config.profiles}
+    try:
+        for name, profile in profiles.items():
+            with ssh_connect(ip, port, profile=profile) as result:
+                ssh = result.unwrap()
+                start = perf_counter()
+                size = ssh.read(
+                    BENCHMARK_FILE, lambda _: None, config.tcpdumper.prefetch_requests
+                ).unwrap()
+                elapsed = perf_counter() - start
+            print(f"Profile {name}: {size / max(elapsed, 1e-6) / 1e6:.2f} MB/s")
+    finally:
+        with ssh_connect(ip, port) as result:
+            _ = result.unwrap().remove(BENCHMARK_FILE)
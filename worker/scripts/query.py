@@ -0,0 +1,78 @@
+from __future__ import annotations
+from datetime import date, datetime
+from ipaddress import ip_address
+from time import localtime, perf_counter, strftime
+from typing import Annotated, Optional
+
+from typer import BadParameter, Option
+from worker.config import INDEX_FILE, get_config
+from worker.index import open_index
+from worker.pcap import PROTOCOL_NAMES
+
+TIME_FORMATS = ["%H:%M", "%H:%M:%S"]
+
+
+def parse_time(value: str) -> float:
+    for format in TIME_FORMATS:
+        try:
+            time = datetime.strptime(value, format).time()
+        except ValueError:
+            continue
+        return datetime.combine(date.today(), time).timestamp()
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError as e:
+        raise BadParameter(
+            f"Invalid time {value}, use HH:MM[:SS] or an ISO date"
+        ) from e
+
+
+def format_time(timestamp: float) -> str:
+    return (
+        f"{strftime('%H:%M:%S', localtime(timestamp))}.{int(timestamp % 1 * 1000):03}"
+    )
+
+
+def query(
+    start: Annotated[
+        Optional[str], Option(help="Only flows active after this time, as HH:MM[:SS]")
+    ] = None,
+    end: Annotated[
+        Optional[str], Option(help="Only flows active before this time, as HH:MM[:SS]")
+    ] = None,
+    host: Annotated[
+        Optional[str], Option(help="Only flows from or to this address")
+    ] = None,
+    team: Annotated[
+        Optional[int], Option(help="Only flows from or to this team's vulnbox")
+    ] = None,
+    port: Annotated[
+        Optional[int], Option(help="Only flows from or to this port")
+    ] = None,
+    limit: Annotated[int, Option(help="Maximum number of flows to show")] = 100,
+    index_file: Annotated[str, Option(help="Index of the backups")] = INDEX_FILE,
+):
+    """Find the backups and byte offsets of the flows matching a time range, host and port, offsets of .gz backups are into their decompressed pcap"""
+    config = get_config()
+    if team is not None:
+        host = config.teams.format.format(team)
+    if host is not None:
+        try:
+            host = str(ip_address(host))
+        except ValueError as e:
+            raise BadParameter(str(e)) from e
+    begin = perf_counter()
+    entries = open_index(index_file).query(
+        None if start is None else parse_time(start),
+        None if end is None else parse_time(end),
+        host,
+        port,
+        limit,
+    )
+    elapsed = perf_counter() - begin
+    for entry in entries:
+        unit = "decompressed bytes" if entry.file.endswith(".gz") else "bytes"
+        print(
+            f"{entry.file} {unit} {entry.first_offset}-{entry.last_offset} {format_time(entry.first)}-{format_time(entry.last)} {PROTOCOL_NAMES.get(entry.protocol, entry.protocol)} {entry.source}:{entry.source_port} -> {entry.destination}:{entry.destination_port} {entry.packets} packets {entry.bytes} bytes"
+        )
+    print(f"Found {len(entries)} flows in {elapsed * 1000:.1f} ms")
@@ -0,0 +1,149 @@
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from gzip import open as gzip_open
+from os import listdir, makedirs, remove, stat
+from os.path import basename, join
+from shutil import copyfileobj
+from time import perf_counter, sleep
+from typing import Annotated, BinaryIO, Optional, cast
+
+from httpx import HTTPError
+from termcolor import cprint
+from typer import BadParameter, Option
+from worker.config import BACKUP_FOLDER, INDEX_FILE, REPLAY_FOLDER, get_config
+from worker.filter import FilterRules, filter_pcap
+from worker.index import Index, open_index
+from worker.pcap import READ_SIZE, PcapError
+from worker.scripts.query import parse_time
+from worker.worker import IMPORT_POLL_INTERVAL, pending_imports, submit_pcap
+
+
+def select_backups(
+    index: Index,
+    backup_folder: str,
+    start: float | None,
+    end: float | None,
+    ports: list[int] | None,
+) -> list[tuple[float, str, int]]:
+    config = get_config()
+    spans = index.spans()
+    matching = None if ports is None else index.files_with_ports(ports)
+    backups: list[tuple[float, str, int]] = []
+    for name in listdir(backup_folder):
+        if not name.endswith((".pcap", ".pcap.gz")):
+            continue
+        info = stat(join(backup_folder, name))
+        first, last = spans.get(name, (None, None))
+        if first is None or last is None:
+            first, last = info.st_mtime - config.tcpdumper.interval, info.st_mtime
+        elif matching is not None and name not in matching:
+            continue
+        if (start is not None and last < start) or (end is not None and first > end):
+            continue
+        backups.append((first, join(backup_folder, name), info.st_size))
+    return sorted(backups)
+
+
+def prepare(file: str, ports: list[int] | None, service: str | None) -> str:
+    name = basename(file)
+    compressed = name.endswith(".gz")
+    if ports is None and not compressed:
+        return file
+    target_file = join(REPLAY_FOLDER, f"{service or 'all'}-{name.removesuffix('.gz')}")
+    with cast(
+        BinaryIO, (gzip_open if compressed else open)(file, "rb")
+    ) as source, open(target_file, "wb") as destination:
+        if ports is None:
+            copyfileobj(source, destination, READ_SIZE)
+        else:
+            _ = filter_pcap(
+                source,
+                destination,
+                FilterRules(frozenset(), (), frozenset(ports), None),
+            )
+    return target_file
+
+
+def wait_for_imports(limit: int) -> None:
+    while (pending := pending_imports()) is not None and pending >= limit:
+        sleep(IMPORT_POLL_INTERVAL)
+
+
+def replay(
+    start: Annotated[
+        Optional[str], Option(help="Start of the time window, as HH:MM[:SS]")
+    ] = None,
+    end: Annotated[
+        Optional[str], Option(help="End of the time window, as HH:MM[:SS]")
+    ] = None,
+    service: Annotated[
+        Optional[str], Option(help="Only replay the traffic of this service")
+    ] = None,
+    concurrency: Annotated[
+        Optional[int],
+        Option(
+            help="Pcaps Caronte may import at once, defaults to max_pending_imports"
+        ),
+    ] = None,
+    backup_folder: Annotated[str, Option(help="Folder of the backups")] = BACKUP_FOLDER,
+    index_file: Annotated[str, Option(help="Index of the backups")] = INDEX_FILE,
+):
+    """Submit again to Caronte the backups of a time window"""
+    config = get_config()
+    ports = None
+    if service is not None:
+        if service not in config.services:
+            raise BadParameter(f"Unknown service {service}")
+        ports = config.services[service].ports
+    limit = concurrency or config.caronte.max_pending_imports or 4
+    backups = select_backups(
+        open_index(index_file),
+        backup_folder,
+        None if start is None else parse_time(start),
+        None if end is None else parse_time(end),
+        ports,
+    )
+    if not backups:
+        print("No backups in the time window")
+        return
+    makedirs(REPLAY_FOLDER, exist_ok=True)
+    total = sum(size for _, _, size in backups)
+    done = 0
+    failed = 0
+    begin = perf_counter()
+    with ThreadPoolExecutor(limit) as executor:
+        prepared: deque[Future[str]] = deque()
+        for number, (_, file, size) in enumerate(backups, 1):
+            while len(prepared) < limit and number + len(prepared) <= len(backups):
+                _, next_file, _ = backups[number + len(prepared) - 1]
+                prepared.append(executor.submit(prepare, next_file, ports, service))
+            try:
+                replay_file = prepared.popleft().result()
+            except (PcapError, OSError) as e:
+                cprint(f"Error reading {basename(file)}: {e}", "light_red")
+                failed += 1
+                replay_file = None
+            if replay_file is not None:
+                wait_for_imports(limit)
+                try:
+                    submit_pcap(replay_file, replay_file != file)
+                except HTTPError as e:
+                    cprint(f"Error submitting {basename(file)}: {e}", "light_red")
+                    if replay_file != file:
+                        remove(replay_file)
+                    failed += 1
+            done += size
+            elapsed = perf_counter() - begin
+            eta = (total - done) * elapsed / max(done, 1)
+            print(
+                f"[{number}/{len(backups)}] {basename(file)}: {done / 1e6:.1f}/{total / 1e6:.1f} MB in {elapsed:.0f} seconds, ETA {eta:.0f} seconds"
+            )
+    print("Waiting for Caronte to import the last pcaps")
+    wait_for_imports(1)
+    elapsed = perf_counter() - begin
+    print(
+        f"Replayed {len(backups) - failed} backups ({total / 1e6:.1f} MB) in {elapsed:.0f} seconds ({total / max(elapsed, 1e-6) / 1e6:.2f} MB/s)"
+    )
+    if failed:
+        exit(1)
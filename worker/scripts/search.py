@@ -0,0 +1,73 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from os import listdir, stat
+from os.path import join
+from time import localtime, perf_counter, strftime
+from typing import Annotated, Optional
+
+from typer import Option
+from worker.config import BACKUP_FOLDER, INDEX_FILE, get_config
+from worker.index import open_index
+from worker.pcap import PROTOCOL_NAMES
+from worker.search import SearchHit, patterns_key, search_pcap
+from worker.utils import cpu_count
+
+
+def format_hit(hit: SearchHit) -> str:
+    time = strftime("%H:%M:%S", localtime(hit.timestamp))
+    unit = "decompressed byte" if hit.file.endswith(".gz") else "byte"
+    if hit.protocol is None:
+        return f"{hit.file} {unit} {hit.offset} {time} {hit.match}"
+    return f"{hit.file} {unit} {hit.offset} {time} {PROTOCOL_NAMES.get(hit.protocol, hit.protocol)} {hit.source}:{hit.source_port} -> {hit.destination}:{hit.destination_port} {hit.match}"
+
+
+def search(
+    pattern: Annotated[
+        Optional[list[str]], Option(help="Extra regex to search besides the flags")
+    ] = None,
+    workers: Annotated[
+        Optional[int], Option(help="Number of processes, defaults to the cpus")
+    ] = None,
+    cache: Annotated[
+        bool, Option(help="Reuse the hits of the backups already searched")
+    ] = True,
+    backup_folder: Annotated[str, Option(help="Folder of the backups")] = BACKUP_FOLDER,
+    index_file: Annotated[str, Option(help="Index of the backups")] = INDEX_FILE,
+):
+    """Search the flags and other regexes in the backups"""
+    config = get_config()
+    patterns = [config.flag.format, *(pattern or [])]
+    key = patterns_key(patterns)
+    index = open_index(index_file)
+    start = perf_counter()
+    hits: list[SearchHit] = []
+    pending: list[tuple[str, int, float]] = []
+    for name in sorted(listdir(backup_folder)):
+        if not name.endswith((".pcap", ".pcap.gz")):
+            continue
+        info = stat(join(backup_folder, name))
+        cached = (
+            index.cached_hits(name, key, info.st_size, info.st_mtime) if cache else None
+        )
+        if cached is None:
+            pending.append((name, info.st_size, info.st_mtime))
+        else:
+            hits.extend(cached)
+    scanned = sum(size for _, size, _ in pending)
+    if pending:
+        with ProcessPoolExecutor(min(workers or cpu_count(), len(pending))) as executor:
+            results = executor.map(
+                partial(search_pcap, patterns=patterns),
+                [join(backup_folder, name) for name, _, _ in pending],
+            )
+            for (name, size, mtime), result in zip(pending, results):
+                hits.extend(result)
+                if cache:
+                    index.cache_hits(name, key, size, mtime, result)
+    elapsed = perf_counter() - start
+    for hit in sorted(hits, key=lambda hit: hit.timestamp):
+        print(format_hit(hit))
+    print(
+        f"Found {len(hits)} matches, scanned {len(pending)} backups ({scanned / 1e6:.1f} MB) in {elapsed:.2f} seconds ({scanned / max(elapsed, 1e-6) / 1e6:.2f} MB/s)"
+    )
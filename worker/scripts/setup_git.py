@@ -25,9 +25,10 @@ def setup_git(
         ssh = result.unwrap()
         ssh.check_call("git config --global user.email adserver@example.com").unwrap()
         ssh.check_call("git config --global user.name ADServer").unwrap()
-        for service in services:
+        initialized = ssh.exists_many([f"{service}/.git" for service in services])
+        for service, exists in zip(services, initialized):
             service_name = basename(service)
-            if ssh.exists(f"{service}/.git").unwrap():
+            if exists.unwrap():
                 cprint(
                     f"Warning: Skipping service {service} since the .git folder already exists",
                     "yellow",
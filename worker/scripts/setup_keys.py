@@ -2,6 +2,7 @@ from result import Err, Ok, Result
 from typer import Option
 from worker.ssh import SSHError, ssh_connect, SSH
 from worker.config import (
+    CAPTURE_SCRIPT,
     get_config,
     get_git_host,
     get_ssh_keys,
@@ -97,11 +98,14 @@ def install_tools(ssh: SSH):
 def install_keys(ssh: SSH):
     config = get_config()
     _ = ssh.call("mkdir -p /root/.ssh").unwrap()
-    for key in get_ssh_keys(config.sshkeys.github_users).unwrap():
-        ssh.check_call(f"echo {quote(key)} >> /root/.ssh/authorized_keys").unwrap()
-    ssh.check_call(
+    commands = [
+        f"echo {quote(key)} >> /root/.ssh/authorized_keys"
+        for key in get_ssh_keys(config.sshkeys.github_users).unwrap()
+    ]
+    commands.append(
         f"ssh-keyscan -t rsa {quote(get_git_host(config.git.git_repo).unwrap())} >> /root/.ssh/known_hosts"
-    ).unwrap()
+    )
+    ssh.check_call_many(commands).unwrap()
 
 
 def install_aliases(ssh: SSH):
@@ -123,7 +127,7 @@ def install_private_key(ssh: SSH):
 def start_tcpdump(ssh: SSH, interface_ip: str | None, ssh_port: int | None):
     config = get_config()
     if interface_ip is None:
-        interface_ip = config.server.host
+        interface_ip = config.server.game_ip or config.server.host
     if ssh_port is None:
         ssh_port = config.server.port
     match get_interface_name(ssh, interface_ip):
@@ -139,6 +143,12 @@ def start_tcpdump(ssh: SSH, interface_ip: str | None, ssh_port: int | None):
     print("The interface name is", interface)
     ssh.check_call(f"mkdir -p {quote(config.tcpdumper.dumps_folder)}").unwrap()
     _ = ssh.call("pkill tcpdump").unwrap()
+    if config.tcpdumper.capture == "stream":
+        command = f"exec tcpdump -U -w - -Z root -i {quote(interface)} not port {ssh_port} 2> /dev/null"
+        ssh.check_call(
+            f"echo {quote(command)} > {quote(config.tcpdumper.dumps_folder)}/{CAPTURE_SCRIPT}"
+        ).unwrap()
+        return
     ssh.popen(
         f"tcpdump -w {quote(config.tcpdumper.dumps_folder)}/%H-%M-%S.pcap -G {config.tcpdumper.interval} -Z root -i {quote(interface)} -z gzip not port {ssh_port} > /dev/null 2> /dev/null",
     ).unwrap()
@@ -0,0 +1,141 @@
+from __future__ import annotations
+from bisect import bisect_right
+from gzip import open as gzip_open
+from hashlib import sha256
+from mmap import ACCESS_READ, mmap
+from os.path import basename, getsize
+from re import compile
+from collections.abc import Callable
+from attrs import evolve, frozen
+from worker.pcap import (
+    GLOBAL_HEADER_SIZE,
+    MAX_PACKET_SIZE,
+    RECORD_HEADER_SIZE,
+    Packet,
+    PcapError,
+    PcapFormat,
+    decode_packet,
+    parse_header,
+)
+
+SEARCH_CHUNK = 1 << 24
+
+
+@frozen
+class SearchHit:
+    file: str
+    offset: int
+    timestamp: float
+    match: str
+    protocol: int | None = None
+    source: str | None = None
+    source_port: int | None = None
+    destination: str | None = None
+    destination_port: int | None = None
+
+
+def patterns_key(patterns: list[str]) -> str:
+    return sha256("\n".join(patterns).encode()).hexdigest()
+
+
+def record_offsets(data: bytes | mmap, format: PcapFormat) -> list[int]:
+    offsets: list[int] = []
+    position = GLOBAL_HEADER_SIZE
+    while position + RECORD_HEADER_SIZE <= len(data):
+        offsets.append(position)
+        _, _, length, _ = format.record.unpack_from(data, position)
+        position += RECORD_HEADER_SIZE + length
+    return offsets
+
+
+def search_data(name: str, data: bytes | mmap, patterns: list[str]) -> list[SearchHit]:
+    regex = compile(b"|".join(b"(?:%b)" % pattern.encode() for pattern in patterns))
+    matches = list(regex.finditer(data, GLOBAL_HEADER_SIZE))
+    if not matches:
+        return []
+    format = parse_header(data[:GLOBAL_HEADER_SIZE])
+    offsets = record_offsets(data, format)
+    hits: list[SearchHit] = []
+    for match in matches:
+        index = bisect_right(offsets, match.start()) - 1
+        if index < 0:
+            continue
+        offset = offsets[index]
+        seconds, fraction, length, original_length = format.record.unpack_from(
+            data, offset
+        )
+        start = offset + RECORD_HEADER_SIZE
+        if match.start() < start or match.end() > start + length:
+            continue
+        packet = Packet(
+            seconds, fraction, original_length, bytes(data[start : start + length])
+        )
+        segment = decode_packet(format, packet)
+        text = match.group().decode(errors="replace")
+        if segment is None:
+            hits.append(SearchHit(name, offset, format.timestamp(packet), text))
+            continue
+        flow = segment.flow
+        hits.append(
+            SearchHit(
+                name,
+                offset,
+                format.timestamp(packet),
+                text,
+                flow.protocol,
+                str(flow.source),
+                flow.source_port,
+                str(flow.destination),
+                flow.destination_port,
+            )
+        )
+    return hits
+
+
+def complete_records(data: bytearray, format: PcapFormat) -> int:
+    position = 0
+    max_size = max(format.snaplen, MAX_PACKET_SIZE)
+    while position + RECORD_HEADER_SIZE <= len(data):
+        _, _, length, _ = format.record.unpack_from(data, position)
+        if length > max_size:
+            raise PcapError(f"Invalid packet length {length}")
+        if position + RECORD_HEADER_SIZE + length > len(data):
+            break
+        position += RECORD_HEADER_SIZE + length
+    return position
+
+
+def search_stream(
+    name: str,
+    read: Callable[[int], bytes],
+    patterns: list[str],
+    chunk_size: int = SEARCH_CHUNK,
+) -> list[SearchHit]:
+    header = read(GLOBAL_HEADER_SIZE)
+    if len(header) < GLOBAL_HEADER_SIZE:
+        return []
+    format = parse_header(header)
+    hits: list[SearchHit] = []
+    buffer = bytearray()
+    offset = 0
+    while chunk := read(chunk_size):
+        buffer += chunk
+        end = complete_records(buffer, format)
+        hits.extend(
+            evolve(hit, offset=hit.offset + offset)
+            for hit in search_data(name, header + buffer[:end], patterns)
+        )
+        del buffer[:end]
+        offset += end
+    return hits
+
+
+def search_pcap(path: str, patterns: list[str]) -> list[SearchHit]:
+    name = basename(path)
+    if name.endswith(".gz"):
+        with gzip_open(path, "rb") as file:
+            return search_stream(name, file.read, patterns)
+    if getsize(path) <= GLOBAL_HEADER_SIZE:
+        return []
+    with open(path, "rb") as file, mmap(file.fileno(), 0, access=ACCESS_READ) as data:
+        return search_data(name, data, patterns)
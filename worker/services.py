@@ -0,0 +1,35 @@
+from __future__ import annotations
+from os.path import basename
+from worker.config import get_config
+from worker.pcap import Packet, PcapFormat, decode_packet
+
+OTHER_SERVICE = "other"
+SERVICE_SEPARATOR = "@"
+
+
+def service_ports() -> dict[int, str]:
+    config = get_config()
+    return {
+        port: name
+        for name, service in config.services.items()
+        for port in service.ports
+    }
+
+
+def packet_service(ports: dict[int, str], format: PcapFormat, packet: Packet) -> str:
+    segment = decode_packet(format, packet)
+    if segment is None:
+        return OTHER_SERVICE
+    flow = segment.flow
+    return ports.get(flow.destination_port, ports.get(flow.source_port, OTHER_SERVICE))
+
+
+def capture_service(file: str) -> str | None:
+    service, separator, _ = basename(file).partition(SERVICE_SEPARATOR)
+    return service if separator else None
+
+
+def capture_priority(file: str) -> int:
+    config = get_config()
+    service = config.services.get(capture_service(file) or OTHER_SERVICE)
+    return 0 if service is None else service.priority
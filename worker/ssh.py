@@ -1,30 +1,167 @@
 from __future__ import annotations
 from logging import getLogger
-from paramiko import MissingHostKeyPolicy, SSHClient, SFTPClient, SSHException
+from paramiko import (
+    Channel,
+    MissingHostKeyPolicy,
+    SSHClient,
+    SFTPAttributes,
+    SFTPClient,
+    SSHException,
+    Transport,
+)
 from collections.abc import Callable, Generator
 from typing import Any
 from sys import stdout, stderr
-from time import sleep
+from select import select
+from time import monotonic, perf_counter
+from socket import IPPROTO_TCP, TCP_NODELAY, socket
 from contextlib import contextmanager
-from attrs import frozen
-from functools import cached_property
+from functools import partial
+from attrs import define, field, frozen
+from threading import Lock, Thread
+from concurrent.futures import Future, ThreadPoolExecutor
 from result import Err, Ok, Result
 from subprocess import SubprocessError
-from worker.config import get_config
+from worker.config import get_config, NETWORK_ATTEMPTS_INTERVAL, Profile
+from worker.utils import stopping
+from worker.ratelimit import RateLimiter
 
 SSHError = SSHException | OSError
 SSH_ERROR = (SSHException, OSError)
 LOGGER = getLogger(__name__)
+POLL_INTERVAL = 1
+MAX_CONCURRENT_COMMANDS = 8
+PING_REQUEST = "keepalive@openssh.com"
+
+
+def log_stderr(data: bytes) -> None:
+    LOGGER.debug(f"Remote stderr: {data!r}")
+
+
+@frozen
+class SSHStream:
+    _channel: Channel
+    _onerr: Callable[[bytes], Any]
+    _buffer_size: int
+    _ping: Callable[[], Result[float, SSHError]] | None = None
+    _idle_interval: float = 0
+
+    def chunks(self, heartbeat: bool = False) -> Generator[bytes, None, None]:
+        channel = self._channel
+        received = monotonic()
+        while True:
+            eof = channel.eof_received or channel.closed
+            while channel.recv_stderr_ready():
+                self._onerr(channel.recv_stderr(self._buffer_size))
+            if channel.recv_ready():
+                received = monotonic()
+                yield channel.recv(self._buffer_size)
+            elif eof:
+                return
+            else:
+                ready, _, _ = select([channel], [], [], POLL_INTERVAL)
+                if ready:
+                    continue
+                if (
+                    self._ping is not None
+                    and monotonic() - received >= self._idle_interval
+                ):
+                    result = self._ping()
+                    if isinstance(result, Err):
+                        raise result.err_value
+                    received = monotonic()
+                if heartbeat:
+                    yield b""
+
+    def lines(self, heartbeat: bool = False) -> Generator[bytes, None, None]:
+        buffer = b""
+        for chunk in self.chunks(heartbeat):
+            if not chunk:
+                yield chunk
+                continue
+            *lines, buffer = (buffer + chunk).split(b"\n")
+            yield from lines
+        if buffer:
+            yield buffer
+
+    def wait(self) -> Result[int, SSHError]:
+        try:
+            return Ok(self._channel.recv_exit_status())
+        except SSH_ERROR as e:
+            return Err(e)
 
 
 @frozen(slots=False)
 class SSH:
     _client: SSHClient
     _print_command_info: tuple[str, str, int] | None = None
+    _sftp_clients: list[SFTPClient] = field(factory=list[SFTPClient], init=False)
+    _sftp_lock: Lock = field(factory=Lock, init=False)
+    _ping_lock: Lock = field(factory=Lock, init=False)
+
+    @contextmanager
+    def _sftp(self) -> Generator[SFTPClient, None, None]:
+        with self._sftp_lock:
+            sftp = self._sftp_clients.pop() if self._sftp_clients else None
+        if sftp is None:
+            LOGGER.debug("Opening new sftp channel")
+            sftp = self._client.open_sftp()
+            channel = sftp.get_channel()
+            assert channel is not None
+            channel.settimeout(get_config().server.timeout)
+        try:
+            yield sftp
+        except BaseException:
+            sftp.close()
+            raise
+        with self._sftp_lock:
+            self._sftp_clients.append(sftp)
+
+    def probe(self, timeout: float) -> Result[None, SSHError]:
+        transport = self._client.get_transport()
+        if transport is None or not transport.is_active():
+            return Err(SSHException("Transport is not active"))
+        try:
+            transport.open_session(timeout=timeout).close()
+        except SSH_ERROR as e:
+            return Err(e)
+        return Ok(None)
 
-    @cached_property
-    def _sftp(self) -> SFTPClient:
-        return self._client.open_sftp()
+    def ping(self, timeout: float) -> Result[float, SSHError]:
+        transport = self._client.get_transport()
+        if transport is None or not transport.is_active():
+            return Err(SSHException("Transport is not active"))
+        if not self._ping_lock.acquire(timeout=timeout):
+            return Err(SSHException(f"Previous ping pending for {timeout} seconds"))
+        reply: Future[None] = Future()
+
+        def request() -> None:
+            try:
+                _ = transport.global_request(PING_REQUEST, wait=True)
+                if not transport.is_active():
+                    raise SSHException("Transport closed while waiting for the ping")
+                reply.set_result(None)
+            except SSH_ERROR as e:
+                reply.set_exception(e)
+            finally:
+                self._ping_lock.release()
+
+        start = perf_counter()
+        Thread(target=request, name="ping", daemon=True).start()
+        try:
+            reply.result(timeout)
+        except TimeoutError:
+            LOGGER.warning(
+                f"No ping reply in {timeout} seconds, closing the connection"
+            )
+            transport.close()
+            return Err(SSHException(f"No ping reply in {timeout} seconds"))
+        except SSH_ERROR as e:
+            return Err(e)
+        return Ok(perf_counter() - start)
+
+    def close(self) -> None:
+        self._client.close()
 
     def print_command(self, cmd: str) -> None:
         if self._print_command_info is not None:
@@ -75,6 +212,31 @@ class SSH:
             return result
         return Ok((result.ok_value, bytes(stdout), bytes(stderr)))
 
+    def run_many(
+        self, commands: list[str], concurrency: int = MAX_CONCURRENT_COMMANDS
+    ) -> list[Result[tuple[int, bytes, bytes], SSHError]]:
+        with ThreadPoolExecutor(concurrency) as executor:
+            return list(executor.map(self.run, commands))
+
+    def check_call_many(
+        self, commands: list[str], concurrency: int = MAX_CONCURRENT_COMMANDS
+    ) -> Result[None, SSHError | SubprocessError]:
+        results = self.run_many(commands, concurrency)
+        for result in results:
+            if isinstance(result, Ok):
+                _, out, err = result.ok_value
+                _ = stdout.buffer.write(out)
+                _ = stderr.buffer.write(err)
+        _ = stdout.flush()
+        _ = stderr.flush()
+        for result in results:
+            if isinstance(result, Err):
+                return result
+            exit_code, _, _ = result.ok_value
+            if exit_code != 0:
+                return Err(SubprocessError(exit_code))
+        return Ok(None)
+
     def __run(
         self,
         command: str,
@@ -82,30 +244,52 @@ class SSH:
         onerr: Callable[[bytes], Any],
         input: bytes = b"",
     ) -> Result[int, SSHError]:
+        with self.stream(command, input, onerr) as result:
+            if isinstance(result, Err):
+                return result
+            stream = result.ok_value
+            try:
+                for chunk in stream.chunks():
+                    onout(chunk)
+            except SSH_ERROR as e:
+                return Err(e)
+            return stream.wait()
+
+    @contextmanager
+    def stream(
+        self,
+        command: str,
+        input: bytes = b"",
+        onerr: Callable[[bytes], Any] = log_stderr,
+        window_size: int | None = None,
+    ) -> Generator[Result[SSHStream, SSHError], None, None]:
         self.print_command(command)
         LOGGER.debug(f"Exec ssh command {command}")
+        transport = self._client.get_transport()
+        if transport is None:
+            yield Err(SSHException("SSH session not active"))
+            return
         try:
-            _, stdout, _ = self._client.exec_command(command)
-            channel = stdout.channel
+            channel = transport.open_session(window_size=window_size)
+            channel.exec_command(command)
             while input:
                 input = input[channel.send(input) :]
-            while True:
-                exit = channel.exit_status_ready()
-                while channel.recv_ready():
-                    recv = channel.recv(1024)
-                    if not recv:
-                        break
-                    onout(recv)
-                while channel.recv_stderr_ready():
-                    recv = channel.recv(1024)
-                    if not recv:
-                        break
-                    onerr(recv)
-                if exit:
-                    return Ok(channel.exit_status)
-                sleep(0.1)
         except SSH_ERROR as e:
-            return Err(e)
+            yield Err(e)
+            return
+        config = get_config()
+        try:
+            yield Ok(
+                SSHStream(
+                    channel,
+                    onerr,
+                    config.server.buffer_size,
+                    partial(self.ping, config.server.timeout),
+                    config.server.keepalive,
+                )
+            )
+        finally:
+            channel.close()
 
     def put(self, localpath: str, remotepath: str) -> Result[None, SSHError]:
         if self._print_command_info is not None:
@@ -113,27 +297,82 @@ class SSH:
             print(f"$ scp -P {port} {localpath} {user}@{host}:{remotepath}")
         LOGGER.debug(f"Uploading file from {localpath} to {remotepath}")
         try:
-            _ = self._sftp.put(localpath, remotepath)
+            with self._sftp() as sftp:
+                _ = sftp.put(localpath, remotepath)
         except SSH_ERROR as e:
             return Err(e)
         return Ok(None)
 
     def listdir(self, path: str) -> Result[list[str], SSHError]:
         try:
-            return Ok(self._sftp.listdir(path))
+            with self._sftp() as sftp:
+                return Ok(sftp.listdir(path))
         except SSH_ERROR as e:
             return Err(e)
 
-    def get(self, remote_path: str, local_path: str) -> Result[None, SSHError]:
+    def get(
+        self,
+        remote_path: str,
+        local_path: str,
+        prefetch_requests: int | None = None,
+    ) -> Result[int, SSHError]:
         try:
-            self._sftp.get(remote_path, local_path)
+            with open(local_path, "wb") as file:
+                return self.read(remote_path, file.write, prefetch_requests)
+        except OSError as e:
+            return Err(e)
+
+    def read(
+        self,
+        remote_path: str,
+        onchunk: Callable[[bytes], Any],
+        prefetch_requests: int | None = None,
+        block_size: int = 32768,
+        offset: int = 0,
+        limiter: RateLimiter | None = None,
+    ) -> Result[int, SSHError]:
+        LOGGER.debug(f"Reading remote file {remote_path} from offset {offset}")
+        size = 0
+        try:
+            with self._sftp() as sftp, sftp.open(remote_path, "rb") as file:
+                file.seek(offset)
+                file.prefetch(max_concurrent_requests=prefetch_requests)
+                while chunk := file.read(block_size):
+                    onchunk(chunk)
+                    size += len(chunk)
+                    if limiter is None:
+                        continue
+                    limiter.acquire(len(chunk))
+                    if limiter.rtt_due():
+                        result = self.ping(get_config().server.timeout)
+                        if isinstance(result, Err):
+                            return result
+                        limiter.observe_rtt(result.ok_value)
+        except SSH_ERROR as e:
+            return Err(e)
+        return Ok(size)
+
+    def read_range(
+        self, remote_path: str, offset: int, size: int
+    ) -> Result[bytes, SSHError]:
+        try:
+            with self._sftp() as sftp, sftp.open(remote_path, "rb") as file:
+                file.seek(offset)
+                return Ok(file.read(size))
+        except SSH_ERROR as e:
+            return Err(e)
+
+    def stat(self, remote_path: str) -> Result[SFTPAttributes, SSHError]:
+        try:
+            with self._sftp() as sftp:
+                return Ok(sftp.stat(remote_path))
         except SSH_ERROR as e:
             return Err(e)
-        return Ok(None)
 
     def remove(self, remote_path: str) -> Result[None, SSHError]:
         try:
-            self._sftp.remove(remote_path)
+            with self._sftp() as sftp:
+                sftp.remove(remote_path)
         except SSH_ERROR as e:
             return Err(e)
         return Ok(None)
@@ -144,6 +383,61 @@ class SSH:
             return result
         return Ok(result.ok_value == 0)
 
+    def exists_many(self, paths: list[str]) -> list[Result[bool, SSHError]]:
+        results = self.run_many([f"[ -e '{path}' ]" for path in paths])
+        return [
+            Ok(result.ok_value[0] == 0) if isinstance(result, Ok) else result
+            for result in results
+        ]
+
+
+def profile_transport(profile: Profile) -> Callable[..., Transport]:
+    def transport_factory(sock: Any, **kwargs: Any) -> Transport:
+        transport = Transport(
+            sock,
+            default_window_size=profile.window_size,
+            default_max_packet_size=profile.max_packet_size,
+            **kwargs,
+        )
+        options = transport.get_security_options()
+        if profile.ciphers is not None:
+            options.ciphers = profile.ciphers
+        if profile.macs is not None:
+            options.digests = profile.macs
+        return transport
+
+    return transport_factory
+
+
+def open_client(
+    ip: str, port: int, user: str, profile: Profile | None = None
+) -> Result[SSHClient, SSHError]:
+    config = get_config()
+    if profile is None:
+        profile = config.transport_profile()
+    LOGGER.debug(f"Opening ssh connection to {user}@{ip}:{port}")
+    client = SSHClient()
+    client.set_missing_host_key_policy(MissingHostKeyPolicy())
+    try:
+        client.connect(
+            ip,
+            port,
+            user,
+            config.server.password,
+            timeout=config.server.timeout,
+            compress=profile.compress,
+            transport_factory=profile_transport(profile),
+        )
+    except SSH_ERROR as exception:
+        client.close()
+        return Err(exception)
+    transport = client.get_transport()
+    assert transport is not None
+    transport.set_keepalive(config.server.keepalive)
+    if isinstance(transport.sock, socket):
+        transport.sock.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+    return Ok(client)
+
 
 @contextmanager
 def ssh_connect(
@@ -152,18 +446,56 @@ def ssh_connect(
     /,
     *,
     print_commands: bool = False,
+    profile: Profile | None = None,
 ) -> Generator[Result[SSH, SSHError], None, None]:
     config = get_config()
     ip = config.server.host if ip is None else ip
     port = config.server.port if port is None else port
     user = "root"
-    LOGGER.debug(f"Opening ssh connection to {user}@{ip}:{port}")
-    with SSHClient() as client:
-        client.set_missing_host_key_policy(MissingHostKeyPolicy())
-        try:
-            client.connect(ip, port, user, config.server.password, timeout=10)
-        except SSH_ERROR as exception:
-            yield Err(exception)
-            return
+    result = open_client(ip, port, user, profile)
+    if isinstance(result, Err):
+        yield result
+        return
+    with result.ok_value as client:
         ssh = SSH(client, (user, ip, port) if print_commands else None)
         yield Ok(ssh)
+
+
+@define
+class SSHSession:
+    _ip: str | None = None
+    _port: int | None = None
+    _ssh: SSH | None = field(default=None, init=False)
+    _failures: int = field(default=0, init=False)
+
+    def get(self) -> SSH | None:
+        config = get_config()
+        if self._ssh is not None:
+            result = self._ssh.probe(config.server.timeout)
+            if isinstance(result, Ok):
+                return self._ssh
+            LOGGER.warning(f"Vulnbox connection is not healthy: {result.err_value}")
+            self.close()
+        ip = config.server.host if self._ip is None else self._ip
+        port = config.server.port if self._port is None else self._port
+        while not stopping.is_set():
+            result = open_client(ip, port, "root")
+            if isinstance(result, Ok):
+                self._failures = 0
+                self._ssh = SSH(result.ok_value)
+                return self._ssh
+            backoff = min(
+                NETWORK_ATTEMPTS_INTERVAL * 2**self._failures,
+                config.server.max_backoff,
+            )
+            self._failures += 1
+            LOGGER.error(
+                f"Error connecting to the vulnbox, retrying in {backoff} seconds: {result.err_value}",
+            )
+            _ = stopping.wait(backoff)
+        return None
+
+    def close(self) -> None:
+        if self._ssh is not None:
+            self._ssh.close()
+            self._ssh = None
@@ -2,6 +2,9 @@ from logging import getLogger
 from signal import SIGTERM, signal
 from typing import Any, Protocol, TypeVar, cast
 from sys import exit
+from os import sched_getaffinity
+from math import ceil
+from threading import Event
 
 from pydantic import ConfigDict
 
@@ -19,6 +22,24 @@ def no_extra(cls: T) -> T:
     return cls
 
 
-def add_sigterm():
+stopping = Event()
+
+
+def add_sigterm(drain: bool = False):
     LOGGER.debug("Registering SIGTERM signal")
-    _ = signal(SIGTERM, lambda _, __: exit())
+    if drain:
+        _ = signal(SIGTERM, lambda _, __: stopping.set())
+    else:
+        _ = signal(SIGTERM, lambda _, __: exit())
+
+
+def cpu_count() -> int:
+    cpus = len(sched_getaffinity(0))
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+    except (OSError, ValueError):
+        return cpus
+    if quota == "max":
+        return cpus
+    return max(1, min(cpus, ceil(int(quota) / int(period))))
@@ -1,10 +1,23 @@
 from __future__ import annotations
-from os import makedirs, listdir, remove
-from os.path import exists, join, splitext
-from time import sleep
-from shutil import copyfile, copyfileobj
+from os import makedirs, listdir, remove, rename, utime
+from os.path import basename, exists, getmtime, getsize, join, splitext
+from time import monotonic, perf_counter, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from threading import Thread
+from collections import Counter, deque
+from collections.abc import Callable
+from contextlib import ExitStack
+from shlex import quote
+from shutil import which
+from subprocess import PIPE, CalledProcessError, Popen
 from gzip import open as gzip_open
-from httpx import post
+from zlib import decompressobj, MAX_WBITS
+from paramiko import SFTPAttributes, SSHException
+from hashlib import file_digest, sha256
+from attrs import define
+from httpx import HTTPError
+from json import JSONDecodeError
 
 from result import Err, Ok, Result
 from worker.config import (
@@ -12,14 +25,74 @@ from worker.config import (
     UNCOMPRESSED_FOLDER,
     BACKUP_FOLDER,
     DATA_FOLDER,
+    PARTIAL_FOLDER,
     NETWORK_ATTEMPTS_INTERVAL,
     get_config,
 )
-from worker.ssh import SSH, ssh_connect, SSHError
-from typing import NoReturn, Optional
+from worker.ssh import SSH, SSH_ERROR, SSHSession, ssh_connect, SSHError
+from worker.pipeline import Pipeline, Stage, start_pipeline
+from worker.capture import capture
+from worker.pcap import (
+    GLOBAL_HEADER_SIZE,
+    PcapError,
+    demux_pcap,
+    merge_pcaps,
+    split_pcap,
+)
+from worker.filter import FilterStats, filter_pcap, filter_rules
+from worker.services import (
+    SERVICE_SEPARATOR,
+    capture_priority,
+    capture_service,
+    packet_service,
+    service_ports,
+)
+from worker.utils import add_sigterm, cpu_count, stopping
+from worker.journal import get_journal
+from worker.index import get_index, summarize_pcap
+from worker.leaks import LeakStats, leak_detector
+from worker.retention import start_retention
+from worker.ratelimit import get_limiter
+from worker.clients import caronte_client
+from typing import Any, BinaryIO, NoReturn, Optional
+from sys import exit
 from logging import getLogger
 
 LOGGER = getLogger()
+RESUME_OVERLAP = 65536
+IMPORT_POLL_INTERVAL = 1
+ZERO_TIME = "0001-01-01"
+BATCH_SUFFIX = ".batch.pcap"
+PREPARE_STAGE = -2
+UPLOAD_STAGE = -1
+GZIP_DECODERS = ["igzip", "pigz"]
+WATCH_SCRIPT = """cd {} || exit 1
+if command -v inotifywait > /dev/null 2> /dev/null; then
+    exec inotifywait -m -q -e close_write -e moved_to --format %f .
+fi
+seen=""
+while true; do
+    next=""
+    for name in *.gz; do
+        [ -e "$name" ] && [ ! -e "${{name%.gz}}" ] || continue
+        next="$next $name"
+        case " $seen " in *" $name "*) ;; *) echo "$name" ;; esac
+    done
+    seen="$next"
+    sleep 1
+done"""
+
+
+@define
+class DownloadStats:
+    resumed_files: int = 0
+    saved_bytes: int = 0
+
+
+download_stats = DownloadStats()
+ready_captures: list[str] = []
+filter_stats = FilterStats()
+leak_stats = LeakStats()
 
 
 def worker_check(
@@ -31,43 +104,76 @@ def worker_check(
     with ssh_connect(ip, port) as result:
         ssh = result.unwrap()
         assert ssh.check_call("pgrep tcpdump").is_ok()
-        assert len(ssh.listdir(config.tcpdumper.dumps_folder).unwrap()) <= 2
+        if config.tcpdumper.capture == "rotate":
+            assert len(ssh.listdir(config.tcpdumper.dumps_folder).unwrap()) <= 2
     compressed = listdir(join(data_folder, "compressed"))
     uncompressed = listdir(join(data_folder, "uncompressed"))
     backups = listdir(join(data_folder, "backup"))
-    assert len(compressed) <= 1
-    assert len(uncompressed) <= 1
     assert len(backups) >= 1
     for name in compressed:
         assert splitext(name)[1] == ".gz"
     for name in uncompressed:
         assert splitext(name)[1] == ".pcap"
     for name in backups:
-        assert splitext(name)[1] == ".pcap"
+        assert name.endswith((".pcap", ".pcap.gz"))
 
 
 def worker() -> NoReturn:
     config = get_config()
+    add_sigterm(drain=True)
     LOGGER.debug("Creating local dumps folders")
     makedirs(COMPRESSED_FOLDER, exist_ok=True)
     makedirs(UNCOMPRESSED_FOLDER, exist_ok=True)
     makedirs(BACKUP_FOLDER, exist_ok=True)
-    while True:
+    makedirs(PARTIAL_FOLDER, exist_ok=True)
+    start_retention()
+    pipeline = start_worker_pipeline() if config.tcpdumper.pipeline else None
+    handoff = (
+        start_capture_handoff(pipeline)
+        if config.tcpdumper.capture == "stream"
+        else None
+    )
+    session = SSHSession()
+    while not stopping.is_set():
         LOGGER.info("Starting worker loop")
-        with ssh_connect() as result:
-            if isinstance(result, Err):
-                LOGGER.error(
-                    f"Error connecting to the vulnbox, retrying in {NETWORK_ATTEMPTS_INTERVAL} seconds: {result.err_value}",
-                )
-                sleep(NETWORK_ATTEMPTS_INTERVAL)
-                continue
-            ssh = result.ok_value
-            while not ssh.exists(config.tcpdumper.dumps_folder).unwrap():
-                LOGGER.warning(f"Missing server dumps folder, waiting for its creation")
-                sleep(1)
+        ssh = session.get()
+        if ssh is None:
+            break
+        result = ssh.exists(config.tcpdumper.dumps_folder)
+        if isinstance(result, Err):
+            LOGGER.error(
+                f"Error checking the server dumps folder, retrying in {NETWORK_ATTEMPTS_INTERVAL} seconds: {result.err_value}",
+            )
+            _ = stopping.wait(NETWORK_ATTEMPTS_INTERVAL)
+            continue
+        if not result.ok_value:
+            LOGGER.warning(f"Missing server dumps folder, waiting for its creation")
+            _ = stopping.wait(1)
+            continue
+        if config.tcpdumper.capture == "stream":
+            assert handoff is not None
+            stream_loop(ssh, handoff)
+            _ = stopping.wait(NETWORK_ATTEMPTS_INTERVAL)
+            continue
+        if config.tcpdumper.watch:
+            watch_loop(ssh, pipeline)
+            _ = stopping.wait(NETWORK_ATTEMPTS_INTERVAL)
+            continue
+        if pipeline is None:
             loop(ssh)
+        else:
+            pipeline_loop(ssh, pipeline)
         LOGGER.debug(f"Sleeping for {config.tcpdumper.interval} seconds")
-        sleep(config.tcpdumper.interval)
+        _ = stopping.wait(config.tcpdumper.interval)
+    if handoff is not None:
+        LOGGER.info("Draining the captured pcaps before exiting")
+        handoff.join()
+    if pipeline is not None:
+        LOGGER.info("Draining the pipeline before exiting")
+        pipeline.join()
+    session.close()
+    LOGGER.info("Worker stopped")
+    exit(0)
 
 
 def loop(client: SSH) -> None:
@@ -82,69 +188,790 @@ def loop(client: SSH) -> None:
     upload_all()
 
 
+def stream_loop(client: SSH, handoff: Pipeline) -> None:
+    LOGGER.debug("Starting streamed capture")
+    result = capture(client, handoff.put)
+    if isinstance(result, Err):
+        LOGGER.warning(f"Capture stream dropped: {result.err_value}")
+    else:
+        LOGGER.warning(f"Capture stream exited with code {result.ok_value}")
+
+
+def start_capture_handoff(pipeline: Optional[Pipeline]) -> Pipeline:
+    def handoff_stage(file: str) -> list[None]:
+        if pipeline is None:
+            upload_all()
+        else:
+            _ = pipeline.put(file, PREPARE_STAGE)
+        return []
+
+    return start_pipeline([Stage("handoff", handoff_stage)], 0)
+
+
+def watch_loop(client: SSH, pipeline: Optional[Pipeline]) -> None:
+    config = get_config()
+    LOGGER.debug("Starting dumps folder watcher")
+    command = WATCH_SCRIPT.format(quote(config.tcpdumper.dumps_folder))
+    with client.stream(f"sh -c {quote(command)}") as result:
+        if isinstance(result, Err):
+            LOGGER.warning(f"Error starting the watcher: {result.err_value}")
+            return
+        stream = result.ok_value
+        recent: deque[str] = deque(maxlen=1024)
+        listed = None
+        try:
+            for line in stream.lines(heartbeat=True):
+                if stopping.is_set():
+                    break
+                if line:
+                    names = [line.decode()]
+                elif (
+                    listed is None or monotonic() - listed >= config.tcpdumper.interval
+                ):
+                    result = list_dumps(client)
+                    if isinstance(result, Err):
+                        LOGGER.warning(f"Error listing pcaps: {result.err_value}")
+                        return
+                    names, listed = result.ok_value, monotonic()
+                else:
+                    continue
+                fetch_dumps(client, pipeline, names, recent)
+        except SSH_ERROR as e:
+            LOGGER.warning(f"Watcher connection dropped: {e}")
+            return
+    LOGGER.warning("Watcher exited")
+
+
+def fetch_dumps(
+    client: SSH, pipeline: Optional[Pipeline], names: list[str], recent: deque[str]
+) -> None:
+    names = [
+        name for name in names if splitext(name)[1] == ".gz" and name not in recent
+    ]
+    for name in names:
+        LOGGER.debug(f"Dump {name} is ready")
+        if pipeline is not None:
+            _ = pipeline.put((client, name), key=name)
+            continue
+        result = download(client, name)
+        if isinstance(result, Err):
+            LOGGER.warning(f"Error downloading pcap {name}: {result.err_value}")
+            continue
+        recent.append(name)
+    if pipeline is None and names:
+        extract_all()
+        upload_all()
+
+
 def rsync(client: SSH) -> Result[None, SSHError]:
+    config = get_config()
+    result = list_dumps(client)
+    if isinstance(result, Err):
+        return result
+    with ThreadPoolExecutor(config.tcpdumper.download_workers) as executor:
+        for result in executor.map(partial(download, client), result.ok_value):
+            if isinstance(result, Err):
+                return result
+    return Ok(None)
+
+
+def list_dumps(client: SSH) -> Result[list[str], SSHError]:
     config = get_config()
     result = client.listdir(config.tcpdumper.dumps_folder)
     if isinstance(result, Err):
         if isinstance(result.err_value, FileNotFoundError):
             raise result.err_value
         return result
-    for name in result.ok_value:
-        _, ext = splitext(name)
-        if ext == ".gz":
-            remote_file = join(config.tcpdumper.dumps_folder, name)
-            local_file = join(COMPRESSED_FOLDER, name)
-            LOGGER.debug(f"Starting download of file {name}")
-            result = client.get(remote_file, local_file)
-            if isinstance(result, Err):
-                if exists(local_file):
-                    remove(local_file)
-                return result
-            LOGGER.debug("Removing remote file")
-            result = client.remove(remote_file)
-            if isinstance(result, Err):
-                if exists(local_file):
-                    remove(local_file)
-                return result
+    names: list[str] = []
+    for name in sorted(result.ok_value):
+        stem, ext = splitext(name)
+        if ext == ".gz" and stem not in result.ok_value:
+            names.append(name)
         else:
             LOGGER.debug(f"Skipping download of file {name}")
+    return Ok(names)
+
+
+def download(client: SSH, name: str) -> Result[str | None, SSHError]:
+    config = get_config()
+    remote_file = join(config.tcpdumper.dumps_folder, name)
+    result = client.stat(remote_file)
+    if isinstance(result, Err):
+        return result
+    attributes = result.ok_value
+    entry = get_journal().get(splitext(name)[0])
+    if (
+        entry is not None
+        and entry.size == attributes.st_size
+        and entry.mtime == attributes.st_mtime
+    ):
+        LOGGER.info(f"File {name} was already downloaded, removing remote file")
+        result = client.remove(remote_file)
+        if isinstance(result, Err):
+            return result
+        return Ok(None)
+    if config.tcpdumper.stream_download:
+        return stream_extract(client, name, attributes)
+    partial_file = join(PARTIAL_FOLDER, name)
+    local_file = join(COMPRESSED_FOLDER, name)
+    size = attributes.st_size or 0
+    result = resume_offset(client, remote_file, partial_file, size)
+    if isinstance(result, Err):
+        return result
+    offset = result.ok_value
+    checksum = sha256()
+    if offset > 0:
+        with open(partial_file, "rb") as file:
+            checksum = file_digest(file, "sha256")
+        download_stats.resumed_files += 1
+        download_stats.saved_bytes += offset
+        LOGGER.info(
+            f"Resuming download of file {name} from byte {offset}, {download_stats.saved_bytes} bytes saved by resuming in total"
+        )
+    LOGGER.debug(f"Starting download of file {name}")
+    start = perf_counter()
+    with open(partial_file, "ab") as file:
+
+        def onchunk(chunk: bytes) -> None:
+            checksum.update(chunk)
+            _ = file.write(chunk)
+
+        result = client.read(
+            remote_file,
+            onchunk,
+            config.tcpdumper.prefetch_requests,
+            offset=offset,
+            limiter=get_limiter(),
+        )
+    if isinstance(result, Err):
+        return result
+    log_throughput(name, result.ok_value, perf_counter() - start)
+    if offset + result.ok_value != size:
+        remove(partial_file)
+        return Err(
+            SSHException(
+                f"Downloaded {offset + result.ok_value} bytes of file {name} instead of {size}"
+            )
+        )
+    result = verify_checksum(client, remote_file, checksum.hexdigest())
+    if isinstance(result, Err):
+        remove(partial_file)
+        return result
+    rename(partial_file, local_file)
+    get_journal().reset(
+        splitext(name)[0],
+        "downloaded",
+        checksum.hexdigest(),
+        size,
+        attributes.st_mtime or 0,
+    )
+    LOGGER.debug("Removing remote file")
+    result = client.remove(remote_file)
+    if isinstance(result, Err):
+        return result
+    return Ok(local_file)
+
+
+def resume_offset(
+    client: SSH, remote_file: str, partial_file: str, size: int
+) -> Result[int, SSHError]:
+    if not exists(partial_file):
+        return Ok(0)
+    offset = getsize(partial_file)
+    overlap = min(offset, RESUME_OVERLAP)
+    if 0 < offset <= size:
+        result = client.read_range(remote_file, offset - overlap, overlap)
+        if isinstance(result, Err):
+            return result
+        with open(partial_file, "rb") as file:
+            _ = file.seek(offset - overlap)
+            if file.read(overlap) == result.ok_value:
+                return Ok(offset)
+    LOGGER.debug(f"Discarding stale partial file {partial_file}")
+    remove(partial_file)
+    return Ok(0)
+
+
+def verify_checksum(
+    client: SSH, remote_file: str, checksum: str
+) -> Result[None, SSHError]:
+    result = client.run(f"sha256sum {quote(remote_file)}")
+    if isinstance(result, Err):
+        return result
+    exit_code, out, err = result.ok_value
+    if exit_code != 0:
+        LOGGER.warning(
+            f"Error hashing remote file {remote_file}, checking its size only: {err!r}"
+        )
+    elif out.split()[:1] != [checksum.encode()]:
+        return Err(SSHException(f"Checksum mismatch downloading file {remote_file}"))
     return Ok(None)
 
 
+def stream_extract(
+    client: SSH, name: str, attributes: SFTPAttributes
+) -> Result[str, SSHError]:
+    config = get_config()
+    remote_file = join(config.tcpdumper.dumps_folder, name)
+    partial_file = join(PARTIAL_FOLDER, splitext(name)[0])
+    target_file = join(UNCOMPRESSED_FOLDER, splitext(name)[0])
+    partial_backup = join(PARTIAL_FOLDER, name)
+    keep_compressed = config.tcpdumper.backup == "compressed"
+    decompressor = decompressobj(16 + MAX_WBITS)
+    checksum = sha256()
+    detector = leak_detector(splitext(name)[0])
+    LOGGER.debug(f"Starting streamed extraction of file {name}")
+    start = perf_counter()
+    with open(partial_file, "wb") as file, ExitStack() as stack:
+        backup = (
+            stack.enter_context(open(partial_backup, "wb")) if keep_compressed else None
+        )
+
+        def onchunk(chunk: bytes) -> None:
+            checksum.update(chunk)
+            if backup is not None:
+                _ = backup.write(chunk)
+            data = decompressor.decompress(chunk)
+            if detector is not None:
+                detector.feed(data)
+            _ = file.write(data)
+
+        result = client.read(
+            remote_file,
+            onchunk,
+            config.tcpdumper.prefetch_requests,
+            limiter=get_limiter(),
+        )
+        if isinstance(result, Ok) and not decompressor.eof:
+            result = Err(SSHException(f"Truncated gzip file {name}"))
+        if isinstance(result, Err):
+            file.close()
+            stack.close()
+            remove(partial_file)
+            if keep_compressed:
+                remove(partial_backup)
+            return result
+        data = decompressor.flush()
+        if detector is not None:
+            detector.feed(data)
+        _ = file.write(data)
+    log_throughput(name, result.ok_value, perf_counter() - start)
+    result = verify_checksum(client, remote_file, checksum.hexdigest())
+    if isinstance(result, Err):
+        remove(partial_file)
+        if keep_compressed:
+            remove(partial_backup)
+        return result
+    if detector is not None:
+        leak_stats.add(splitext(name)[0], detector.leaks)
+    rename(partial_file, target_file)
+    if keep_compressed:
+        rename(partial_backup, join(BACKUP_FOLDER, name))
+    get_journal().reset(
+        splitext(name)[0],
+        "extracted",
+        checksum.hexdigest(),
+        attributes.st_size or 0,
+        attributes.st_mtime or 0,
+    )
+    LOGGER.debug("Removing remote file")
+    result = client.remove(remote_file)
+    if isinstance(result, Err):
+        return result
+    return Ok(target_file)
+
+
+def log_throughput(name: str, size: int, elapsed: float) -> None:
+    limiter = get_limiter()
+    LOGGER.info(
+        f"Downloaded file {name}: {size} bytes in {elapsed:.2f} seconds ({size / max(elapsed, 1e-6) / 1e6:.2f} MB/s)"
+    )
+    if limiter.rate is not None:
+        LOGGER.info(
+            f"Transfer rate {limiter.measured / 1e6:.2f} MB/s, limited to {limiter.rate / 1e6:.2f} MB/s"
+        )
+
+
 def extract_all():
-    for name in listdir(COMPRESSED_FOLDER):
-        source_file = join(COMPRESSED_FOLDER, name)
-        target_file = join(UNCOMPRESSED_FOLDER, splitext(name)[0])
-        LOGGER.debug(f"Extracting file {name}")
-        gunzip(source_file, target_file)
+    config = get_config()
+    files = [join(COMPRESSED_FOLDER, name) for name in listdir(COMPRESSED_FOLDER)]
+    if len(files) <= 1:
+        for file in files:
+            _ = extract(file)
+        return
+    workers = config.tcpdumper.extract_workers or cpu_count()
+    with ProcessPoolExecutor(min(workers, len(files))) as executor:
+        for target_file, leaks in executor.map(extract_scanned, files):
+            leak_stats.add(basename(target_file), leaks)
+
+
+def extract(source_file: str) -> str:
+    target_file, leaks = extract_scanned(source_file)
+    leak_stats.add(basename(target_file), leaks)
+    return target_file
+
+
+def extract_scanned(source_file: str) -> tuple[str, Counter[str]]:
+    config = get_config()
+    name = basename(source_file)
+    partial_file = join(PARTIAL_FOLDER, splitext(name)[0])
+    target_file = join(UNCOMPRESSED_FOLDER, splitext(name)[0])
+    detector = leak_detector(splitext(name)[0])
+    LOGGER.debug(f"Extracting file {name}")
+    start = perf_counter()
+    gunzip(source_file, partial_file, None if detector is None else detector.feed)
+    elapsed = perf_counter() - start
+    size = getsize(partial_file)
+    LOGGER.info(
+        f"Extracted file {name}: {size} bytes in {elapsed:.2f} seconds ({size / max(elapsed, 1e-6) / 1e6:.2f} MB/s)"
+    )
+    rename(partial_file, target_file)
+    get_journal().record(splitext(name)[0], "extracted")
+    if config.tcpdumper.backup == "compressed":
+        LOGGER.debug(f"Keeping file {name} as backup")
+        rename(source_file, join(BACKUP_FOLDER, name))
+    else:
         LOGGER.debug(f"Removing file {name}")
         remove(source_file)
+    return target_file, Counter() if detector is None else detector.leaks
+
 
+def gunzip(
+    source_filepath: str,
+    dest_filepath: str,
+    onchunk: Optional[Callable[[bytes], Any]] = None,
+) -> None:
+    config = get_config()
+    block_size = config.tcpdumper.extract_buffer_size
+    decoder = gzip_decoder()
+    if decoder is None:
+        with gzip_open(source_filepath, "rb") as s_file, open(
+            dest_filepath, "wb"
+        ) as d_file:
+            copy_chunks(s_file.read, d_file.write, block_size, onchunk)
+        return
+    with open(dest_filepath, "wb") as d_file, Popen(
+        [decoder, "-dc", source_filepath], stdout=PIPE, bufsize=block_size
+    ) as process:
+        assert process.stdout is not None
+        copy_chunks(process.stdout.read, d_file.write, block_size, onchunk)
+    if process.returncode != 0:
+        raise CalledProcessError(process.returncode, process.args)
 
-def gunzip(source_filepath: str, dest_filepath: str, block_size: int = 65536) -> None:
-    with gzip_open(source_filepath, "rb") as s_file, open(
-        dest_filepath, "wb"
-    ) as d_file:
-        copyfileobj(s_file, d_file, block_size)
+
+def copy_chunks(
+    read: Callable[[int], bytes],
+    write: Callable[[bytes], Any],
+    block_size: int,
+    onchunk: Optional[Callable[[bytes], Any]],
+) -> None:
+    while chunk := read(block_size):
+        if onchunk is not None:
+            onchunk(chunk)
+        _ = write(chunk)
+
+
+def gzip_decoder() -> str | None:
+    for decoder in GZIP_DECODERS:
+        path = which(decoder)
+        if path is not None:
+            return path
+    return None
 
 
 def upload_all() -> None:
+    files = sorted(
+        (join(UNCOMPRESSED_FOLDER, name) for name in listdir(UNCOMPRESSED_FOLDER)),
+        key=getmtime,
+    )
+    _ = upload_captures(
+        [part for file in files for part in prepare_capture(file)],
+        get_config().tcpdumper.interval,
+    )
+
+
+def upload_captures(files: list[str], timeout: float | None = None) -> list[str]:
     config = get_config()
-    for name in listdir(UNCOMPRESSED_FOLDER):
-        file = join(UNCOMPRESSED_FOLDER, name)
-        backup_file = join(BACKUP_FOLDER, name)
+    files, held = merge_ready(files)
+    while files:
+        slots = import_slots(timeout)
+        if slots == 0:
+            if timeout != 0:
+                LOGGER.warning(f"Caronte is behind, keeping {len(files)} pcaps queued")
+            break
+        behind = len(files) > slots
+        batch = [next_capture(files, behind) for _ in range(min(slots, len(files)))]
+        with ThreadPoolExecutor(config.tcpdumper.upload_workers) as executor:
+            futures = [executor.submit(upload, file) for file in batch]
+        failed = [
+            (file, error)
+            for file, future in zip(batch, futures)
+            if (error := future.exception()) is not None
+        ]
+        for file, error in failed:
+            LOGGER.error(f"Error uploading file {basename(file)}: {error}")
+        if failed:
+            files.extend(file for file, _ in failed)
+            break
+    return sorted(files + held, key=getmtime)
+
+
+def next_capture(files: list[str], newest: bool) -> str:
+    priority = max(capture_priority(file) for file in files)
+    candidates = [
+        i for i, file in enumerate(files) if capture_priority(file) == priority
+    ]
+    return files.pop(candidates[-1] if newest else candidates[0])
+
+
+def import_slots(timeout: float | None = None) -> int:
+    config = get_config()
+    limit = config.caronte.max_pending_imports
+    if limit is None:
+        return len(listdir(UNCOMPRESSED_FOLDER))
+    deadline = None if timeout is None else monotonic() + timeout
+    while True:
+        pending = pending_imports()
+        if pending is None:
+            return 1
+        if pending < limit:
+            return limit - pending
+        LOGGER.debug(f"Waiting for Caronte to import {pending} pcaps")
+        if deadline is not None and monotonic() >= deadline:
+            return 0
+        if stopping.wait(IMPORT_POLL_INTERVAL):
+            return 1
+
+
+def pending_imports() -> int | None:
+    try:
+        response = caronte_client().get("/api/pcap/sessions")
+        _ = response.raise_for_status()
+        sessions = response.json()
+    except (HTTPError, JSONDecodeError) as e:
+        LOGGER.warning(f"Error polling Caronte import sessions: {e}")
+        return None
+    return sum(
+        1
+        for session in sessions
+        if str(session.get("completed_at") or ZERO_TIME).startswith(ZERO_TIME)
+    )
+
+
+def filter_capture(file: str) -> str:
+    config = get_config()
+    rules = filter_rules(config.filter)
+    name = basename(file)
+    if not rules.active() or name.endswith(BATCH_SUFFIX):
+        return file
+    filtered = batch_name(batch_stem(file))
+    partial_file = join(PARTIAL_FOLDER, filtered)
+    LOGGER.debug(f"Filtering file {name}")
+    start = perf_counter()
+    try:
+        with open(file, "rb") as source, open(partial_file, "wb") as destination:
+            stats = filter_pcap(source, destination, rules)
+    except PcapError as e:
+        LOGGER.warning(f"Error filtering file {name}, uploading it unfiltered: {e}")
+        remove(partial_file)
+        return file
+    filter_stats.add(stats)
+    LOGGER.info(
+        f"Filtered file {name} in {perf_counter() - start:.2f} seconds: {stats.report()}"
+    )
+    LOGGER.info(f"Filter totals: {filter_stats.report()}")
+    [filtered_file] = publish_batch([filtered], [file])
+    return filtered_file
+
+
+def upload(file: str) -> None:
+    journal = get_journal()
+    name = basename(file)
+    entry = journal.get(name)
+    if entry is not None and entry.stage == "submitted":
+        LOGGER.info(f"File {name} was already submitted, skipping upload")
+    else:
         LOGGER.debug(f"Uploading file {name}")
-        response = post(
-            "http://caronte:3333/api/pcap/file",
-            json={"file": file, "flush_all": False, "delete_original_file": False},
-            auth=(config.caronte.username, config.caronte.password),
+        submit_pcap(file)
+        journal.record(name, "submitted")
+    release(file)
+
+
+def submit_pcap(file: str, delete_original_file: bool = False) -> None:
+    response = caronte_client().post(
+        "/api/pcap/file",
+        json={
+            "file": file,
+            "flush_all": False,
+            "delete_original_file": delete_original_file,
+        },
+    )
+    if response.status_code != 202:
+        LOGGER.error(
+            f"Caronte upload responded with non 202 http code: {response.status_code} {response.text}"
         )
-        if response.status_code != 202:
-            LOGGER.error(
-                f"Caronte upload responded with non 202 http code: {response.status_code} {response.text}"
-            )
-            response.raise_for_status()
-            assert False
-        LOGGER.debug(f"Backing up file before removal")
-        _ = copyfile(file, backup_file)
+        response.raise_for_status()
+        assert False
+
+
+def release(file: str) -> None:
+    name = basename(file)
+    backup_file = join(BACKUP_FOLDER, name)
+    if name.endswith(BATCH_SUFFIX):
+        LOGGER.debug(f"Removing rebatched file {name}")
+        remove(file)
+    elif exists(f"{backup_file}.gz"):
+        index_capture(file, f"{name}.gz")
+        LOGGER.debug(f"Removing file {name} since its compressed backup exists")
         remove(file)
+    else:
+        index_capture(file, name)
+        LOGGER.debug(f"Moving file {name} to the backups")
+        rename(file, backup_file)
+    get_journal().record(name, "backed_up")
+
+
+def index_capture(file: str, backup: str) -> None:
+    config = get_config()
+    if not config.tcpdumper.index:
+        return
+    start = perf_counter()
+    try:
+        with open(file, "rb") as source:
+            summary = summarize_pcap(source)
+    except PcapError as e:
+        LOGGER.warning(f"Error indexing file {basename(file)}: {e}")
+        return
+    get_index().add(backup, summary)
+    LOGGER.debug(
+        f"Indexed {len(summary.flows)} flows of {backup} in {perf_counter() - start:.2f} seconds"
+    )
+
+
+def merge_ready(files: list[str]) -> tuple[list[str], list[str]]:
+    config = get_config()
+    if config.tcpdumper.merge_size is None:
+        return list(files), []
+    services: dict[str | None, list[str]] = {}
+    for file in sorted(files, key=getmtime):
+        services.setdefault(capture_service(file), []).append(file)
+    ready: list[str] = []
+    held: list[str] = []
+    for group in services.values():
+        merged, waiting = merge_captures(group)
+        ready.extend(merged)
+        held.extend(waiting)
+    return sorted(ready, key=getmtime), held
+
+
+def prepare_capture(file: str) -> list[str]:
+    return [
+        part
+        for demuxed in demux_capture(filter_capture(file))
+        for part in split_capture(demuxed)
+    ]
+
+
+def demux_capture(file: str) -> list[str]:
+    config = get_config()
+    name = basename(file)
+    if not config.services or capture_service(file) is not None:
+        return [file]
+    stem = batch_stem(file)
+    names: dict[str, str] = {}
+
+    def open_part(service: str) -> BinaryIO:
+        names[service] = batch_name(f"{service}{SERVICE_SEPARATOR}{stem}")
+        return open(join(PARTIAL_FOLDER, names[service]), "wb")
+
+    start = perf_counter()
+    try:
+        with open(file, "rb") as source:
+            packets = demux_pcap(
+                source, partial(packet_service, service_ports()), open_part
+            )
+    except PcapError as e:
+        LOGGER.warning(f"Error demultiplexing file {name}: {e}")
+        for part in names.values():
+            remove(join(PARTIAL_FOLDER, part))
+        return [file]
+    services = ", ".join(
+        f"{count} packets of {service}" for service, count in packets.items()
+    )
+    LOGGER.info(
+        f"Demultiplexed file {name} in {perf_counter() - start:.2f} seconds: {services or 'no packets'}"
+    )
+    files = publish_batch(list(names.values()), [file])
+    return sorted(files, key=capture_priority, reverse=True)
+
+
+def split_capture(file: str) -> list[str]:
+    config = get_config()
+    split_size = config.tcpdumper.split_size
+    if split_size is None or getsize(file) <= split_size:
+        return [file]
+    stem = batch_stem(file)
+    names: list[str] = []
+
+    def open_part(_: int) -> BinaryIO:
+        names.append(batch_name(stem))
+        return open(join(PARTIAL_FOLDER, names[-1]), "wb")
+
+    start = perf_counter()
+    try:
+        with open(file, "rb") as source:
+            _ = split_pcap(source, split_size, open_part)
+    except PcapError as e:
+        LOGGER.warning(f"Error splitting file {basename(file)}: {e}")
+        for name in names:
+            remove(join(PARTIAL_FOLDER, name))
+        return [file]
+    LOGGER.info(
+        f"Split file {basename(file)} in {len(names)} pcaps in {perf_counter() - start:.2f} seconds"
+    )
+    return publish_batch(names, [file])
+
+
+def merge_captures(files: list[str]) -> tuple[list[str], list[str]]:
+    config = get_config()
+    merge_size = config.tcpdumper.merge_size
+    assert merge_size is not None
+    result: list[str] = []
+    group: list[str] = []
+    group_size = 0
+    header = b""
+    for file in files:
+        size = getsize(file)
+        with open(file, "rb") as source:
+            file_header = source.read(GLOBAL_HEADER_SIZE)
+        if group and (group_size + size > merge_size or file_header != header):
+            result.extend(merge_group(group))
+            group, group_size = [], 0
+        if size >= merge_size:
+            result.append(file)
+            continue
+        group.append(file)
+        group_size += size
+        header = file_header
+    if not group:
+        return result, []
+    if (
+        group_size >= merge_size
+        or time() - getmtime(group[0]) >= config.tcpdumper.merge_delay
+        or stopping.is_set()
+    ):
+        return result + merge_group(group), []
+    LOGGER.debug(f"Holding {len(group)} small pcaps to merge them later")
+    return result, group
+
+
+def merge_group(group: list[str]) -> list[str]:
+    if len(group) == 1:
+        return group
+    name = batch_name(batch_stem(group[0]))
+    start = perf_counter()
+    try:
+        with open(
+            join(PARTIAL_FOLDER, name), "wb"
+        ) as destination, ExitStack() as stack:
+            merge_pcaps(
+                [stack.enter_context(open(file, "rb")) for file in group], destination
+            )
+    except PcapError as e:
+        LOGGER.warning(f"Error merging {len(group)} pcaps: {e}")
+        remove(join(PARTIAL_FOLDER, name))
+        return group
+    LOGGER.info(
+        f"Merged {len(group)} pcaps in {name} in {perf_counter() - start:.2f} seconds"
+    )
+    return publish_batch([name], group)
+
+
+def publish_batch(names: list[str], sources: list[str]) -> list[str]:
+    mtime = getmtime(sources[-1])
+    files: list[str] = []
+    for name in names:
+        partial_file = join(PARTIAL_FOLDER, name)
+        utime(partial_file, (mtime, mtime))
+        files.append(join(UNCOMPRESSED_FOLDER, name))
+        rename(partial_file, files[-1])
+    for source in sources:
+        release(source)
+    return files
+
+
+def batch_stem(file: str) -> str:
+    return basename(file).removesuffix(BATCH_SUFFIX).removesuffix(".pcap")
+
+
+def batch_name(stem: str) -> str:
+    index = 0
+    while exists(join(UNCOMPRESSED_FOLDER, f"{stem}-{index}{BATCH_SUFFIX}")) or exists(
+        join(PARTIAL_FOLDER, f"{stem}-{index}{BATCH_SUFFIX}")
+    ):
+        index += 1
+    return f"{stem}-{index}{BATCH_SUFFIX}"
+
+
+def start_worker_pipeline() -> Pipeline:
+    config = get_config()
+    workers = config.tcpdumper.extract_workers or cpu_count()
+    stages = [Stage("download", download_stage, config.tcpdumper.download_workers)]
+    if config.tcpdumper.stream_download:
+        LOGGER.debug("Extracting leftover compressed files")
+        extract_all()
+    else:
+        stages.append(Stage("extract", extract_stage, workers))
+    stages.append(Stage("prepare", prepare_capture, workers))
+    stages.append(Stage("upload", upload_stage))
+    pipeline = start_pipeline(stages, config.tcpdumper.queue_size)
+    Thread(
+        target=tick_uploads, args=(pipeline,), name="upload-tick", daemon=True
+    ).start()
+    for name in listdir(COMPRESSED_FOLDER):
+        LOGGER.debug(f"Resuming extraction of file {name}")
+        _ = pipeline.put(join(COMPRESSED_FOLDER, name), 1)
+    for name in listdir(UNCOMPRESSED_FOLDER):
+        LOGGER.debug(f"Resuming upload of file {name}")
+        _ = pipeline.put(join(UNCOMPRESSED_FOLDER, name), PREPARE_STAGE)
+    return pipeline
+
+
+def pipeline_loop(client: SSH, pipeline: Pipeline) -> None:
+    result = list_dumps(client)
+    if isinstance(result, Err):
+        LOGGER.warning(f"Connection dropped while listing pcaps: {result.err_value}")
+        return
+    for name in result.ok_value:
+        if not pipeline.put((client, name), key=name):
+            LOGGER.debug(f"Dump {name} is already being downloaded")
+    LOGGER.debug("Waiting for the downloads to complete")
+    pipeline.join(1)
+
+
+def download_stage(item: tuple[SSH, str]) -> list[str]:
+    client, name = item
+    result = download(client, name)
+    if isinstance(result, Err):
+        LOGGER.warning(
+            f"Connection dropped while downloading pcap {name}: {result.err_value}"
+        )
+        return []
+    return [] if result.ok_value is None else [result.ok_value]
+
+
+def extract_stage(file: str) -> list[str]:
+    return [extract(file)]
+
+
+def upload_stage(file: str | None) -> list[None]:
+    global ready_captures
+    if file is not None:
+        ready_captures.append(file)
+    ready_captures = upload_captures(ready_captures, 0)
+    return []
+
+
+def tick_uploads(pipeline: Pipeline) -> None:
+    while not stopping.wait(IMPORT_POLL_INTERVAL):
+        _ = pipeline.put(None, UPLOAD_STAGE, key=UPLOAD_STAGE)